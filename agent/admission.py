@@ -0,0 +1,218 @@
+"""
+Admission control for generations sent to Ollama
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict
+
+
+class AdmissionRejected(Exception):
+    """
+    A request was turned away instead of queued
+
+    status_code is 429 when the queue is full and 503 when the request
+    waited `max_wait_seconds` without getting a slot. retry_after is a
+    hint in whole seconds for the Retry-After header.
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    def as_event(self) -> Dict[str, Any]:
+        """Stream error event for a rejection after the response has started"""
+        return {
+            "type": "error",
+            "message": self.detail,
+            "status_code": self.status_code,
+            "retry_after": self.retry_after,
+        }
+
+
+class Ticket:
+    """A granted slot; release() is idempotent so every exit path may call it"""
+
+    __slots__ = ("_controller", "_started", "released")
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._controller._release(time.monotonic() - self._started)
+
+
+class AdmissionController:
+    """
+    Bounded concurrency with a fair FIFO queue for one model
+
+    Ollama slows down for everyone once it runs more generations than its
+    OLLAMA_NUM_PARALLEL. At most `max_concurrent` requests hold a slot;
+    the next `max_queue` wait in arrival order and a freed slot is handed
+    straight to the oldest waiter, so later arrivals cannot overtake.
+    Beyond that requests are rejected immediately rather than piling up.
+
+    Agents take a slot around each Ollama call only, so cache hits, tool
+    runs and waits on a conversation lock never hold one.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_concurrent: int = 4,
+        max_queue: int = 32,
+        max_wait_seconds: float = 30.0
+    ):
+        self.model = model
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Exponential moving average of how long a slot is held
+        self._service_seconds = 0.0
+
+        self._counters = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+        }
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._queue_peak = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free for a new arrival"""
+        if not self._service_seconds:
+            return 1
+        rounds = (self.queue_depth + 1) / self.max_concurrent
+        return max(1, math.ceil(rounds * self._service_seconds))
+
+    def _free(self) -> bool:
+        return self.active < self.max_concurrent and not self._waiters
+
+    def _reject_queue_full(self):
+        self._counters["rejected_queue_full"] += 1
+        raise AdmissionRejected(
+            429,
+            f"Too many requests queued for {self.model}",
+            self.retry_after()
+        )
+
+    def check(self):
+        """
+        Reject now if a request arriving at this moment would be turned away
+
+        Lets a streaming endpoint answer a real 429 before its response
+        starts; the slots themselves are taken later, per model call.
+
+        Raises:
+            AdmissionRejected: the queue is full (429)
+        """
+        if not self._free() and len(self._waiters) >= self.max_queue:
+            self._reject_queue_full()
+
+    async def admit(self) -> Ticket:
+        """
+        Wait for a slot
+
+        Raises:
+            AdmissionRejected: the queue is full (429) or the wait timed out (503)
+        """
+        if self._free():
+            self.active += 1
+            return self._granted(0.0)
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject_queue_full()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._counters["queued"] += 1
+        self._queue_peak = max(self._queue_peak, len(self._waiters))
+        queued_at = time.monotonic()
+
+        try:
+            await asyncio.wait_for(waiter, self.max_wait_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self._release(None)
+            else:
+                self._remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._counters["rejected_timeout"] += 1
+            raise AdmissionRejected(
+                503,
+                f"Timed out after {self.max_wait_seconds:g}s waiting for {self.model}",
+                self.retry_after()
+            )
+
+        return self._granted(time.monotonic() - queued_at)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for the duration of the block"""
+        ticket = await self.admit()
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _granted(self, waited: float) -> Ticket:
+        self._counters["admitted"] += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        return Ticket(self)
+
+    def _remove(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release(self, held_seconds):
+        if held_seconds is not None:
+            self._service_seconds = (
+                held_seconds if not self._service_seconds
+                else 0.8 * self._service_seconds + 0.2 * held_seconds
+            )
+
+        # Hand the slot to the oldest live waiter; active stays the same
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        admitted = self._counters["admitted"]
+        return {
+            "model": self.model,
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "queue_peak": self._queue_peak,
+            "max_queue": self.max_queue,
+            "wait_seconds_avg": round(self._wait_total / admitted, 3) if admitted else 0.0,
+            "wait_seconds_max": round(self._wait_max, 3),
+            "service_seconds_avg": round(self._service_seconds, 3),
+            **self._counters,
+        }
@@ -0,0 +1,125 @@
+"""
+Batch scheduling of independent single-turn prompts across Ollama hosts
+"""
+
+import asyncio
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List
+
+from agent.core import AIAgent
+
+
+class BatchScheduler:
+    """
+    Run many independent prompts with bounded parallelism per Ollama host
+
+    Each host gets `parallel_per_host` workers pulling from one shared
+    queue, so faster hosts simply take more prompts. Every prompt is a
+    fresh single-turn AIAgent.chat(use_tools=False) whose conversation is
+    deleted afterwards. An agent built with an admission controller takes
+    a slot from it per model call, so batch work queues behind (and never
+    starves) interactive traffic on that host.
+    """
+
+    def __init__(
+        self,
+        agents: Dict[str, AIAgent],
+        parallel_per_host: int = 2
+    ):
+        if not agents:
+            raise ValueError("BatchScheduler needs at least one host")
+        self.agents = agents
+        self.parallel_per_host = parallel_per_host
+
+    async def _complete(self, host: str, prompt: str) -> Dict[str, Any]:
+        agent = self.agents[host]
+        conversation_id = f"batch-{uuid.uuid4()}"
+        try:
+            return await agent.chat(prompt, conversation_id, use_tools=False)
+        finally:
+            await agent.clear_conversation(conversation_id)
+
+    async def run(self, prompts: List[str]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield one result per prompt as it finishes, then a summary
+
+        Results carry the prompt's index since they arrive out of order.
+        Closing the iterator early cancels the outstanding work.
+
+        Yields:
+            {"type": "result", "index", "response", "host", "eval_count", "seconds"}
+            {"type": "error", "index", "host", "message"}
+            {"type": "summary", "prompts", "completed", "errors", "seconds",
+             "eval_count", "tokens_per_second", "hosts"}
+        """
+        pending: asyncio.Queue = asyncio.Queue()
+        for item in enumerate(prompts):
+            pending.put_nowait(item)
+        finished: asyncio.Queue = asyncio.Queue()
+
+        hosts = {
+            host: {"completed": 0, "errors": 0, "eval_count": 0} for host in self.agents
+        }
+
+        async def worker(host: str):
+            while True:
+                try:
+                    index, prompt = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                try:
+                    result = await self._complete(host, prompt)
+                    metadata = result.get("metadata") or {}
+                    if metadata.get("error"):
+                        raise RuntimeError(result["response"])
+                    event = {
+                        "type": "result",
+                        "index": index,
+                        "response": result["response"],
+                        "host": host,
+                        "eval_count": metadata.get("eval_count", 0),
+                        "seconds": round(time.perf_counter() - start, 3)
+                    }
+                except Exception as e:
+                    event = {"type": "error", "index": index, "host": host, "message": str(e)}
+                await finished.put(event)
+
+        start = time.perf_counter()
+        workers = [
+            asyncio.create_task(worker(host))
+            for host in self.agents
+            for _ in range(self.parallel_per_host)
+        ]
+
+        completed = errors = eval_count = 0
+        try:
+            for _ in range(len(prompts)):
+                event = await finished.get()
+                stats = hosts[event["host"]]
+                if event["type"] == "result":
+                    completed += 1
+                    eval_count += event["eval_count"]
+                    stats["completed"] += 1
+                    stats["eval_count"] += event["eval_count"]
+                else:
+                    errors += 1
+                    stats["errors"] += 1
+                yield event
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        seconds = time.perf_counter() - start
+        yield {
+            "type": "summary",
+            "prompts": len(prompts),
+            "completed": completed,
+            "errors": errors,
+            "seconds": round(seconds, 3),
+            "eval_count": eval_count,
+            "tokens_per_second": round(eval_count / seconds, 1) if seconds else 0.0,
+            "hosts": hosts
+        }
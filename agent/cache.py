@@ -0,0 +1,198 @@
+"""
+Response cache for repeated questions
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+
+# Answers that depend on when they were produced must never be replayed
+TIME_SENSITIVE_TOOLS = frozenset({"get_current_time", "search_web"})
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+
+def normalize_prompt(text: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing ?!. so trivial variants match"""
+    text = _WHITESPACE.sub(" ", text.strip().lower())
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def context_hash(history: Iterable[tuple]) -> str:
+    """
+    Hash the (role, content) pairs that precede a prompt
+
+    The same question only shares an answer when the conversation leading
+    up to it is identical; fresh conversations all hash to the same value.
+    """
+    digest = hashlib.sha1()
+    for role, content in history:
+        digest.update(f"{role}\x00{content}\x01".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _Entry:
+    __slots__ = ("context", "response", "expires_at", "vector")
+
+    def __init__(self, context: str, response: str, expires_at: float):
+        self.context = context
+        self.response = response
+        self.expires_at = expires_at
+        # Unit-length numpy vector of the normalized prompt (semantic mode only)
+        self.vector = None
+
+
+class ResponseCache:
+    """
+    Exact-match response cache with optional embedding-similarity lookup
+
+    Keys are (context hash, normalized prompt). When an `embed` function is
+    given (e.g. the all-MiniLM-L6-v2 embedding function from agent/rag.py),
+    misses fall back to the most similar cached prompt under the same
+    context, if its cosine similarity reaches `similarity_threshold`.
+    Embedding and scoring run together in a worker thread, as one matrix
+    product over that context's entries; numpy is needed only in this mode
+    (sentence-transformers already depends on it).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        embed: Optional[Callable[[List[str]], Sequence[Sequence[float]]]] = None,
+        similarity_threshold: float = 0.92
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        # Entries with a vector, grouped by context hash for semantic lookups
+        self._by_context: Dict[str, Dict[tuple, _Entry]] = {}
+        self._counters = {
+            "hits_exact": 0,
+            "hits_semantic": 0,
+            "misses": 0,
+            "stores": 0,
+            "bypassed": 0,
+            "evictions": 0,
+        }
+
+    def _unit_vector(self, text: str):
+        import numpy as np
+
+        vector = np.asarray(self.embed([text])[0], dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _semantic_match(self, text: str, candidates: List[tuple], now: float):
+        """
+        Worker thread: embed the prompt and score it against every candidate
+
+        Returns:
+            Tuple of (best (key, entry) at or above the threshold or None,
+            keys of expired candidates)
+        """
+        import numpy as np
+
+        vector = self._unit_vector(text)
+        scores = np.stack([entry.vector for _, entry in candidates]) @ vector
+        expires = np.fromiter(
+            (entry.expires_at for _, entry in candidates), dtype=np.float64, count=len(candidates)
+        )
+        expired = expires <= now
+        scores[expired] = -np.inf
+
+        best = int(np.argmax(scores))
+        match = candidates[best] if scores[best] >= self.similarity_threshold else None
+        return match, [candidates[i][0] for i in np.flatnonzero(expired)]
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        group = self._by_context.get(entry.context)
+        if group is not None and group.get(key) is entry:
+            del group[key]
+            if not group:
+                del self._by_context[entry.context]
+
+    async def lookup(self, prompt: str, context: str) -> Optional[str]:
+        """Return a cached response for the prompt in this context, if any"""
+        now = time.monotonic()
+        key = (context, normalize_prompt(prompt))
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self._counters["hits_exact"] += 1
+                return entry.response
+            self._remove(key)
+
+        group = self._by_context.get(context) if self.embed is not None else None
+        if group:
+            # Snapshot, so stores and evictions during the await are harmless
+            candidates = list(group.items())
+            match, expired = await asyncio.to_thread(
+                self._semantic_match, key[1], candidates, now
+            )
+            for stale in expired:
+                current = self._entries.get(stale)
+                if current is not None and current.expires_at <= now:
+                    self._remove(stale)
+            if match is not None and self._entries.get(match[0]) is match[1]:
+                self._entries.move_to_end(match[0])
+                self._counters["hits_semantic"] += 1
+                return match[1].response
+
+        self._counters["misses"] += 1
+        return None
+
+    async def store(
+        self,
+        prompt: str,
+        context: str,
+        response: str,
+        tools_used: Iterable[str] = ()
+    ) -> bool:
+        """
+        Cache a response unless a time-sensitive tool contributed to it
+
+        Returns:
+            True if the response was cached
+        """
+        if TIME_SENSITIVE_TOOLS.intersection(tools_used):
+            self._counters["bypassed"] += 1
+            return False
+
+        key = (context, normalize_prompt(prompt))
+        entry = _Entry(context, response, time.monotonic() + self.ttl_seconds)
+        if self.embed is not None:
+            # Sentence-transformer inference is CPU bound; keep it off the event loop
+            entry.vector = await asyncio.to_thread(self._unit_vector, key[1])
+
+        self._remove(key)
+        self._entries[key] = entry
+        if entry.vector is not None:
+            self._by_context.setdefault(context, {})[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._counters["evictions"] += 1
+
+        self._counters["stores"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "semantic": self.embed is not None,
+            **self._counters,
+        }
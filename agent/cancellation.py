@@ -0,0 +1,83 @@
+"""
+Stop generating for clients that have gone away, and count what it saves
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class ClientDisconnected(Exception):
+    """The client left before the response was ready"""
+
+
+class CancellationMetrics:
+    """
+    Counters for generations cut short by client disconnects
+
+    Tokens are estimated from text (agent.context.estimate_tokens). The
+    savings estimate assumes a cancelled answer would have been as long as
+    the average completed one.
+    """
+
+    def __init__(self):
+        self.completed_requests = 0
+        self.completion_tokens = 0
+        self.cancelled_requests = {"chat": 0, "stream": 0}
+        self.tokens_before_cancel = 0
+        self.estimated_tokens_saved = 0
+
+    @property
+    def average_completion_tokens(self) -> float:
+        if not self.completed_requests:
+            return 0.0
+        return self.completion_tokens / self.completed_requests
+
+    def completed(self, tokens: int):
+        self.completed_requests += 1
+        self.completion_tokens += tokens
+
+    def cancelled(self, kind: str, tokens_generated: int = 0):
+        self.cancelled_requests[kind] += 1
+        self.tokens_before_cancel += tokens_generated
+        self.estimated_tokens_saved += max(
+            round(self.average_completion_tokens) - tokens_generated, 0
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cancelled_requests": dict(self.cancelled_requests),
+            "tokens_before_cancel": self.tokens_before_cancel,
+            "estimated_tokens_saved": self.estimated_tokens_saved,
+            "average_completion_tokens": round(self.average_completion_tokens, 1),
+        }
+
+
+async def run_until_disconnected(
+    awaitable: Awaitable,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    poll_interval: float = 0.5
+) -> Any:
+    """
+    Await a result, cancelling it if the client disconnects first
+
+    Cancellation propagates down to the in-flight Ollama HTTP request,
+    which makes Ollama stop generating.
+
+    Raises:
+        ClientDisconnected: the client went away and the work was cancelled
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
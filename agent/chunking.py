@@ -0,0 +1,119 @@
+"""
+Sentence- and paragraph-aware chunking under a token budget
+"""
+
+import re
+from collections import deque
+from typing import Iterator, List, Tuple
+
+from agent.context import CHARS_PER_TOKEN
+
+# all-MiniLM-L6-v2 truncates input at 256 word pieces; stay under it
+DEFAULT_CHUNK_TOKENS = 200
+DEFAULT_OVERLAP_TOKENS = 40
+
+# Whitespace after a paragraph break, or after sentence-ending punctuation
+# (optionally followed by a closing quote or bracket)
+_BOUNDARY = re.compile(
+    r"(?P<para>[ \t]*\n[ \t]*\n\s*)"
+    r"|(?<=[.!?])\s+"
+    r"|(?<=[.!?][\"')\]])\s+"
+)
+
+
+def _segments(text: str, max_chars: int) -> Iterator[Tuple[int, int, bool]]:
+    """
+    (start, end, starts_paragraph) for each sentence, in one finditer pass
+
+    A sentence longer than max_chars is split at the last whitespace that
+    fits (or hard, if there is none). Segments never start or end with
+    whitespace, and whitespace-only stretches yield nothing.
+    """
+    start = 0
+    new_paragraph = False
+    boundaries = _BOUNDARY.finditer(text)
+
+    while True:
+        match = next(boundaries, None)
+        end = match.start() if match else len(text)
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+
+        while end - start > max_chars:
+            limit = start + max_chars
+            cut = max(text.rfind(" ", start + 1, limit), text.rfind("\n", start + 1, limit))
+            if cut == -1:
+                cut = limit
+            piece_end = cut
+            while text[piece_end - 1].isspace():
+                piece_end -= 1
+            yield start, piece_end, new_paragraph
+            new_paragraph = False
+            start = cut
+            while start < end and text[start].isspace():
+                start += 1
+
+        if end > start:
+            yield start, end, new_paragraph
+            new_paragraph = False
+
+        if match is None:
+            return
+        new_paragraph = new_paragraph or match.group("para") is not None
+        start = match.end()
+
+
+def chunk_spans(
+    text: str,
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS
+) -> Iterator[Tuple[int, int]]:
+    """
+    (start, end) offsets of chunks that end on sentence boundaries
+
+    Sentences are packed until the next one would exceed `max_tokens`
+    (estimated as in agent.context.estimate_tokens, but from offsets, so
+    nothing is sliced while packing). A paragraph break closes a chunk that
+    is at least half full. The next chunk starts with the trailing
+    sentences of the previous one that fit in `overlap_tokens`; there is
+    no overlap across paragraph breaks.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = overlap_tokens * CHARS_PER_TOKEN
+    # Sentences of the current chunk, as (start, end)
+    window: deque = deque()
+
+    for start, end, new_paragraph in _segments(text, max_chars):
+        if window:
+            chunk_start, chunk_end = window[0][0], window[-1][1]
+            paragraph_cut = new_paragraph and chunk_end - chunk_start >= max_chars // 2
+            if paragraph_cut or end - chunk_start > max_chars:
+                yield chunk_start, chunk_end
+                if paragraph_cut:
+                    window.clear()
+                while window and chunk_end - window[0][0] > overlap_chars:
+                    window.popleft()
+                while window and end - window[0][0] > max_chars:
+                    window.popleft()
+        window.append((start, end))
+
+    if window:
+        yield window[0][0], window[-1][1]
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS
+) -> List[Tuple[str, int, int]]:
+    """
+    Split text into (chunk, start, end) with character offsets into `text`
+
+    Whitespace-only text yields no chunks.
+    """
+    return [
+        (text[start:end], start, end)
+        for start, end in chunk_spans(text, max_tokens, overlap_tokens)
+    ]
@@ -0,0 +1,80 @@
+"""
+Token-budgeted context window construction
+"""
+
+from typing import Any, Callable, List, Optional, Sequence
+
+
+# Llama/Phi style BPE tokenizers average roughly four characters per token on English text
+CHARS_PER_TOKEN = 4
+
+# Role markers and separators the chat template adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Leaves headroom in Ollama's default 2048-token num_ctx for the start of the reply
+DEFAULT_CONTEXT_TOKENS = 1536
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast local token estimate for a piece of text; O(1), no tokenizer"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _content_of(message: Any) -> str:
+    if isinstance(message, dict):
+        content = message.get("content", "")
+    else:
+        content = getattr(message, "content", "")
+    return content if isinstance(content, str) else str(content)
+
+
+class ContextBuilder:
+    """
+    Selects the newest messages that fit in a token budget
+
+    Older turns are dropped first. The newest message is always kept, even
+    if it alone exceeds the budget, so the model always sees the question.
+    """
+
+    def __init__(self, max_tokens: int = DEFAULT_CONTEXT_TOKENS):
+        self.max_tokens = max_tokens
+        self.dropped_messages = 0
+
+    def message_tokens(self, message: Any) -> int:
+        return estimate_tokens(_content_of(message)) + MESSAGE_OVERHEAD_TOKENS
+
+    def select(
+        self,
+        messages: Sequence[Any],
+        reserved_tokens: int = 0,
+        can_start: Optional[Callable[[Any], bool]] = None
+    ) -> List[Any]:
+        """
+        Return the longest suffix of messages that fits in the budget
+
+        Args:
+            messages: Conversation history, oldest first
+            reserved_tokens: Tokens already spent (system prompt, tool schemas)
+            can_start: Predicate for messages allowed to open the window, e.g.
+                to avoid starting on a tool result whose call was dropped
+
+        Returns:
+            The selected messages, oldest first
+        """
+        budget = self.max_tokens - reserved_tokens
+        used = 0
+        start = len(messages)
+
+        while start > 0:
+            cost = self.message_tokens(messages[start - 1])
+            if used + cost > budget and start < len(messages):
+                break
+            used += cost
+            start -= 1
+
+        if can_start is not None:
+            while start < len(messages) - 1 and not can_start(messages[start]):
+                start += 1
+
+        self.dropped_messages += start
+        return list(messages[start:])
@@ -2,16 +2,38 @@
 Core AI Agent implementation using Ollama and Phi3:latest
 """
 
+import asyncio
 import ollama
+import time
 from typing import List, Dict, Any, Optional, AsyncGenerator
+from contextlib import aclosing, nullcontext
 import uuid
 from datetime import datetime
 
+from agent.admission import AdmissionController, AdmissionRejected
+from agent.cache import ResponseCache, context_hash
+from agent.context import ContextBuilder, DEFAULT_CONTEXT_TOKENS
+from agent.locks import ConversationLocks
+from agent.memory import ConversationStore, InMemoryConversationStore
+from agent.ollama_client import create_async_client
 from agent.prompts import SYSTEM_PROMPT, get_tool_prompt
-from agent.tools import tool_registry, parse_tool_call
+from agent.tools import tool_registry, parse_tool_calls, ToolCallStreamParser
 from models.schemas import Message, AgentState, ToolCall
 
 
+NO_MORE_TOOLS = "No more tools are available. Answer now with the information you have."
+
+
+def encode_message(message: Message) -> str:
+    """Serialize a message for durable conversation stores"""
+    return message.model_dump_json()
+
+
+def decode_message(payload: str) -> Message:
+    """Inverse of encode_message"""
+    return Message.model_validate_json(payload)
+
+
 class AIAgent:
     """
     AI Agent powered by Phi3:latest through Ollama
@@ -21,30 +43,71 @@ class AIAgent:
         self,
         model: str = "phi3:latest",
         temperature: float = 0.7,
-        max_tokens: int = 2048
+        max_tokens: int = 2048,
+        client: Optional[ollama.AsyncClient] = None,
+        store: Optional[ConversationStore] = None,
+        context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+        keep_alive: Optional[str] = "30m",
+        response_cache: Optional[ResponseCache] = None,
+        max_tool_rounds: int = 3,
+        tool_time_budget: float = 30.0,
+        admission: Optional[AdmissionController] = None
     ):
         self.model = model
         self.temperature = temperature
         self.max_tokens = max_tokens
+        # How long Ollama keeps the model loaded after a request ("-1" = forever)
+        self.keep_alive = keep_alive
+        # Shared keep-alive pool; main.py passes the one built in the lifespan
+        self.client = client or create_async_client()
         self.tool_registry = tool_registry
-        self.conversations: Dict[str, AgentState] = {}
+        self.response_cache = response_cache
+        # Upper bounds on the tool loop: reasoning rounds and wall-clock seconds
+        self.max_tool_rounds = max_tool_rounds
+        self.tool_time_budget = tool_time_budget
+        # Bounds concurrent generations on the Ollama server, per model call
+        self.admission = admission
+        self.context = ContextBuilder(max_tokens=context_tokens)
+        # (registry version, system prompt, token count) per use_tools flag
+        self._prompt_cache: Dict[bool, tuple] = {}
+        # Message lists per conversation, bounded by the store's eviction policy
+        self.conversations: ConversationStore = (
+            store if store is not None else InMemoryConversationStore()
+        )
+        # Turns of one conversation run one at a time
+        self.conversation_locks = ConversationLocks()
 
-    def _get_or_create_conversation(
+    async def _get_or_create_conversation(
         self, conversation_id: Optional[str] = None
     ) -> AgentState:
-        if conversation_id and conversation_id in self.conversations:
-            return self.conversations[conversation_id]
-
-        new_id = conversation_id or str(uuid.uuid4())
-        self.conversations[new_id] = AgentState(
-            conversation_id=new_id,
-            messages=[],
-            tool_calls=[]
+        conversation_id = conversation_id or str(uuid.uuid4())
+        # A disk-backed store reads a cache miss off the event loop
+        messages = await self.conversations.aget_or_create(conversation_id)
+
+        # model_construct keeps a reference to the store's list instead of copying it;
+        # tool_calls only cover the current turn
+        return AgentState.model_construct(
+            conversation_id=conversation_id,
+            messages=messages,
+            tool_calls=[],
+            created_at=datetime.now(),
+            updated_at=datetime.now()
         )
-        return self.conversations[new_id]
 
-    def _add_message(self, state: AgentState, role: str, content: str):
-        state.messages.append(Message(role=role, content=content))
+    def _add_turn(self, state: AgentState, user_message: str, response: str):
+        """
+        Append a finished turn
+
+        Nothing is written until the answer exists, so a turn that fails or
+        is cancelled (client disconnect) leaves no orphaned user message.
+        """
+        self.conversations.append(
+            state.conversation_id,
+            [
+                Message(role="user", content=user_message),
+                Message(role="assistant", content=response)
+            ]
+        )
         state.updated_at = datetime.now()
 
     def _add_tool_call(
@@ -62,57 +125,193 @@ class AIAgent:
             )
         )
 
-    async def chat(
+    def _slot(self):
+        """Admission slot held for the duration of one Ollama call"""
+        return self.admission.slot() if self.admission is not None else nullcontext()
+
+    def _cache_context(self, state: AgentState, use_tools: bool) -> Optional[str]:
+        """Response-cache context for the next turn, or None without a cache"""
+        if self.response_cache is None:
+            return None
+        return context_hash(
+            [("use_tools", str(use_tools))]
+            + [(msg.role, msg.content) for msg in state.messages]
+        )
+
+    async def _cached_response(
+        self, state: AgentState, user_message: str, cache_context: Optional[str]
+    ) -> Optional[str]:
+        """Serve the turn from the response cache and save it; returns None on a miss"""
+        if cache_context is None:
+            return None
+        cached = await self.response_cache.lookup(user_message, cache_context)
+        if cached is not None:
+            self._add_turn(state, user_message, cached)
+        return cached
+
+    def _cached_metadata(self, state: AgentState) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "message_count": len(state.messages),
+            "tool_calls": 0,
+            "cached": True
+        }
+
+    async def _save_answer(
         self,
+        state: AgentState,
         user_message: str,
-        conversation_id: Optional[str] = None,
-        use_tools: bool = True
-    ) -> Dict[str, Any]:
-        state = self._get_or_create_conversation(conversation_id)
-        self._add_message(state, "user", user_message)
-
-        messages = self._prepare_messages(state, use_tools)
+        cache_context: Optional[str],
+        response: str
+    ):
+        """Append the finished turn and offer its answer to the response cache"""
+        self._add_turn(state, user_message, response)
+        if cache_context is not None:
+            await self.response_cache.store(
+                user_message,
+                cache_context,
+                response,
+                tools_used=[call.tool_name for call in state.tool_calls]
+            )
 
-        try:
-            response = ollama.chat(
+    async def _complete(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """One non-streaming model call with the agent's generation options"""
+        async with self._slot():
+            return await self.client.chat(
                 model=self.model,
                 messages=messages,
                 options={
                     "temperature": self.temperature,
                     "num_predict": self.max_tokens
-                }
+                },
+                keep_alive=self.keep_alive
             )
 
+    async def _execute_tool(self, name: str, parameters: Dict[str, Any], timeout: float) -> Any:
+        try:
+            return await asyncio.wait_for(
+                self.tool_registry.aexecute(name, parameters), timeout
+            )
+        except asyncio.TimeoutError:
+            return f"Error: Tool '{name}' timed out"
+        except ValueError as e:
+            return f"Error: {str(e)}"
+
+    async def _run_tools(
+        self, state: AgentState, calls: List[tuple], deadline: float
+    ) -> List[tuple]:
+        """Run one round of tool calls concurrently; returns (name, result) in call order"""
+        timeout = max(deadline - time.monotonic(), 0.1)
+        results = await asyncio.gather(
+            *(self._execute_tool(name, params, timeout) for name, params in calls)
+        )
+        for (name, params), result in zip(calls, results):
+            self._add_tool_call(state, name, params, result)
+        return [(name, result) for (name, _), result in zip(calls, results)]
+
+    def _tool_feedback(
+        self, assistant_message: str, results: List[tuple], rounds: int
+    ) -> List[Dict[str, str]]:
+        """Messages that hand a round of tool results back to the model"""
+        tool_results = "\n".join(
+            f"Tool Result ({name}): {result}" for name, result in results
+        )
+        instruction = "Respond naturally using this information."
+        if rounds < self.max_tool_rounds:
+            instruction += (
+                " If you still need more tools, output only the tool calls."
+            )
+
+        return [
+            {"role": "assistant", "content": assistant_message},
+            {"role": "user", "content": f"{tool_results}\n\n{instruction}"}
+        ]
+
+    async def _run_tool_rounds(
+        self,
+        state: AgentState,
+        messages: List[Dict[str, str]],
+        assistant_message: str
+    ) -> tuple:
+        """
+        Execute tool calls and feed results back until the model answers
+
+        Every TOOL_CALL in a response runs concurrently. The model may then
+        call more tools, for up to `max_tool_rounds` rounds and within
+        `tool_time_budget` seconds of wall-clock time.
+
+        Returns:
+            Tuple of (final assistant message, number of tool rounds run,
+            tokens generated by the follow-up calls)
+        """
+        deadline = time.monotonic() + self.tool_time_budget
+        rounds = 0
+        eval_count = 0
+
+        calls = parse_tool_calls(assistant_message)
+        while calls:
+            if rounds >= self.max_tool_rounds or time.monotonic() >= deadline:
+                # Out of budget while the model still wants tools: ask for an answer
+                messages.extend([
+                    {"role": "assistant", "content": assistant_message},
+                    {"role": "user", "content": NO_MORE_TOOLS}
+                ])
+                response = await self._complete(messages)
+                eval_count += response.get("eval_count", 0)
+                return response["message"]["content"], rounds, eval_count
+
+            rounds += 1
+            results = await self._run_tools(state, calls, deadline)
+            messages.extend(self._tool_feedback(assistant_message, results, rounds))
+
+            response = await self._complete(messages)
+            eval_count += response.get("eval_count", 0)
             assistant_message = response["message"]["content"]
+            calls = parse_tool_calls(assistant_message)
 
-            if use_tools:
-                tool_name, parameters = parse_tool_call(assistant_message)
-                if tool_name:
-                    tool_result = self.tool_registry.execute(tool_name, parameters)
-                    self._add_tool_call(state, tool_name, parameters, tool_result)
+        return assistant_message, rounds, eval_count
 
-                    messages.extend([
-                        {"role": "assistant", "content": assistant_message},
-                        {
-                            "role": "user",
-                            "content": (
-                                f"Tool Result ({tool_name}): {tool_result}\n\n"
-                                "Respond naturally using this information."
-                            )
-                        }
-                    ])
+    async def chat(
+        self,
+        user_message: str,
+        conversation_id: Optional[str] = None,
+        use_tools: bool = True
+    ) -> Dict[str, Any]:
+        conversation_id = conversation_id or str(uuid.uuid4())
+        async with self.conversation_locks.hold(conversation_id):
+            return await self._chat(user_message, conversation_id, use_tools)
+
+    async def _chat(
+        self, user_message: str, conversation_id: str, use_tools: bool
+    ) -> Dict[str, Any]:
+        state = await self._get_or_create_conversation(conversation_id)
 
-                    response = ollama.chat(
-                        model=self.model,
-                        messages=messages,
-                        options={
-                            "temperature": self.temperature,
-                            "num_predict": self.max_tokens
-                        }
-                    )
-                    assistant_message = response["message"]["content"]
+        cache_context = self._cache_context(state, use_tools)
+        cached = await self._cached_response(state, user_message, cache_context)
+        if cached is not None:
+            return {
+                "response": cached,
+                "conversation_id": state.conversation_id,
+                "timestamp": datetime.now(),
+                "metadata": self._cached_metadata(state)
+            }
 
-            self._add_message(state, "assistant", assistant_message)
+        messages = self._prepare_messages(state, user_message, use_tools)
+
+        try:
+            response = await self._complete(messages)
+            assistant_message = response["message"]["content"]
+            # Tokens generated, as counted by Ollama
+            eval_count = response.get("eval_count", 0)
+            rounds = 0
+
+            if use_tools:
+                assistant_message, rounds, tool_eval_count = await self._run_tool_rounds(
+                    state, messages, assistant_message
+                )
+                eval_count += tool_eval_count
+
+            await self._save_answer(state, user_message, cache_context, assistant_message)
 
             return {
                 "response": assistant_message,
@@ -121,10 +320,16 @@ class AIAgent:
                 "metadata": {
                     "model": self.model,
                     "message_count": len(state.messages),
-                    "tool_calls": len(state.tool_calls)
+                    "tool_calls": len(state.tool_calls),
+                    "tool_rounds": rounds,
+                    "eval_count": eval_count
                 }
             }
 
+        except AdmissionRejected:
+            # Overload is the caller's to report (429/503), not an answer
+            raise
+
         except Exception as e:
             return {
                 "response": f"Error generating response: {str(e)}",
@@ -133,53 +338,209 @@ class AIAgent:
                 "metadata": {"error": True}
             }
 
-    async def chat_stream(
-        self,
-        user_message: str,
-        conversation_id: Optional[str] = None
-    ) -> AsyncGenerator[str, None]:
-        state = self._get_or_create_conversation(conversation_id)
-        self._add_message(state, "user", user_message)
-
-        messages = self._prepare_messages(state)
-
-        try:
-            stream = ollama.chat(
+    async def _stream_completion(self, messages: List[Dict[str, str]]):
+        """One streaming model call, yielding content chunks; holds its slot until closed"""
+        async with self._slot():
+            stream = await self.client.chat(
                 model=self.model,
                 messages=messages,
                 stream=True,
                 options={
                     "temperature": self.temperature,
                     "num_predict": self.max_tokens
-                }
+                },
+                keep_alive=self.keep_alive
             )
-
-            full_response = ""
-            for chunk in stream:
+            async for chunk in stream:
                 content = chunk["message"]["content"]
-                full_response += content
-                yield content
+                if content:
+                    yield content
+
+    async def stream_events(
+        self,
+        user_message: str,
+        conversation_id: Optional[str] = None,
+        use_tools: bool = True
+    ):
+        """
+        Stream a reply as typed events, running tools mid-stream
+
+        Tokens are forwarded as they arrive. A ToolCallStreamParser holds
+        back TOOL_CALL syntax; when a round ends in tool calls they run
+        concurrently and the follow-up answer streams in the same way, with
+        the same round and time limits as chat().
+
+        Yields dicts with a "type" key:
+            token:      {"content"} - text to show the user
+            tool_start: {"tool", "input"} - a tool call is about to run
+            tool_end:   {"tool", "output"} - a tool call finished
+            metadata:   {"conversation_id", "model", "tool_calls", ...} - once, at the end
+            error:      {"message"} - generation failed; rejections by the
+                        admission queue add "status_code" and "retry_after"
+        """
+        conversation_id = conversation_id or str(uuid.uuid4())
+        async with self.conversation_locks.hold(conversation_id):
+            events = self._stream_events(user_message, conversation_id, use_tools)
+            async with aclosing(events):
+                async for event in events:
+                    yield event
+
+    async def _stream_events(
+        self, user_message: str, conversation_id: str, use_tools: bool
+    ):
+        state = await self._get_or_create_conversation(conversation_id)
+
+        cache_context = self._cache_context(state, use_tools)
+        cached = await self._cached_response(state, user_message, cache_context)
+        if cached is not None:
+            yield {"type": "token", "content": cached}
+            yield {
+                "type": "metadata",
+                "conversation_id": state.conversation_id,
+                **self._cached_metadata(state)
+            }
+            return
+
+        messages = self._prepare_messages(state, user_message, use_tools)
+        deadline = time.monotonic() + self.tool_time_budget
+        rounds = 0
+        final_round = not use_tools
+
+        try:
+            while True:
+                parser = ToolCallStreamParser()
+                parts: List[str] = []
+                # What this round showed the user. Only the last round's text is
+                # the answer; text shown before a tool call is not saved, as in chat()
+                shown: List[str] = []
+
+                # Closed explicitly so the admission slot is freed with the stream
+                async with aclosing(self._stream_completion(messages)) as completion:
+                    async for content in completion:
+                        parts.append(content)
+                        visible = content if final_round else parser.feed(content)
+                        if visible:
+                            shown.append(visible)
+                            yield {"type": "token", "content": visible}
+
+                visible = parser.finish()
+                calls = parse_tool_calls(parser.tool_text) if parser.tool_mode else []
+                if not calls:
+                    # Not a usable tool call after all: show what was held back
+                    visible += parser.tool_text
+                if visible:
+                    shown.append(visible)
+                    yield {"type": "token", "content": visible}
+                if not calls:
+                    break
+
+                assistant_message = "".join(parts)
+                if rounds >= self.max_tool_rounds or time.monotonic() >= deadline:
+                    # Out of budget while the model still wants tools: ask for an answer
+                    messages.extend([
+                        {"role": "assistant", "content": assistant_message},
+                        {"role": "user", "content": NO_MORE_TOOLS}
+                    ])
+                    final_round = True
+                    continue
+
+                rounds += 1
+                for name, params in calls:
+                    yield {"type": "tool_start", "tool": name, "input": params}
+                results = await self._run_tools(state, calls, deadline)
+                for name, result in results:
+                    yield {"type": "tool_end", "tool": name, "output": str(result)}
+
+                messages.extend(self._tool_feedback(assistant_message, results, rounds))
 
-            self._add_message(state, "assistant", full_response)
+        except AdmissionRejected as e:
+            yield e.as_event()
+            return
 
         except Exception as e:
-            yield f"Error: {str(e)}"
+            yield {"type": "error", "message": str(e)}
+            return
 
-    def _prepare_messages(
-        self, state: AgentState, use_tools: bool = False
-    ) -> List[Dict[str, str]]:
-        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        await self._save_answer(state, user_message, cache_context, "".join(shown))
+
+        yield {
+            "type": "metadata",
+            "conversation_id": state.conversation_id,
+            "model": self.model,
+            "message_count": len(state.messages),
+            "tool_calls": len(state.tool_calls),
+            "tool_rounds": rounds
+        }
+
+    async def chat_stream(
+        self,
+        user_message: str,
+        conversation_id: Optional[str] = None,
+        use_tools: bool = True
+    ) -> AsyncGenerator[str, None]:
+        """Streaming chat interface yielding answer text as it arrives"""
+        async for event in self.stream_events(user_message, conversation_id, use_tools):
+            if event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "error":
+                yield f"Error: {event['message']}"
+
+    def _system_prompt(self, use_tools: bool) -> tuple:
+        """
+        System prompt and its token count, built once per registry version
+
+        Reusing the exact same string every turn keeps the prompt prefix
+        byte-identical, which lets Ollama reuse its KV cache for it.
+        """
+        cached = self._prompt_cache.get(use_tools)
+        if cached and cached[0] == self.tool_registry.version:
+            return cached[1], cached[2]
 
+        prompt = SYSTEM_PROMPT
         if use_tools:
-            messages[0]["content"] += "\n\n" + get_tool_prompt(
-                self.tool_registry.get_descriptions()
-            )
+            prompt += "\n\n" + get_tool_prompt(self.tool_registry.get_descriptions())
 
-        for msg in state.messages[-10:]:
+        tokens = self.context.message_tokens({"content": prompt})
+        self._prompt_cache[use_tools] = (self.tool_registry.version, prompt, tokens)
+        return prompt, tokens
+
+    def _prepare_messages(
+        self, state: AgentState, user_message: str, use_tools: bool = False
+    ) -> List[Dict[str, str]]:
+        """Model input for a new turn: system prompt, recent history, then user_message"""
+        system_prompt, system_tokens = self._system_prompt(use_tools)
+        messages = [{"role": "system", "content": system_prompt}]
+        pending = {"role": "user", "content": user_message}
+
+        # The user message is not in state.messages until the turn completes
+        history = self.context.select(
+            state.messages,
+            reserved_tokens=system_tokens + self.context.message_tokens(pending)
+        )
+        for msg in history:
             messages.append({"role": msg.role, "content": msg.content})
 
+        messages.append(pending)
         return messages
 
+    async def warm_up(self):
+        """
+        Load the model and prompt-evaluate the system prompt ahead of traffic
+
+        Generates a single token so the cost is the model load plus the
+        system prompt evaluation, which Ollama then reuses via its KV cache.
+        """
+        system_prompt, _ = self._system_prompt(use_tools=True)
+        await self.client.chat(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": "Hi"}
+            ],
+            options={"num_predict": 1},
+            keep_alive=self.keep_alive
+        )
+
     async def health_check(self) -> Dict[str, Any]:
         """
         Reliable health check:
@@ -187,7 +548,7 @@ class AIAgent:
         - verifies model availability
         """
         try:
-            ollama.show(self.model)
+            await self.client.show(self.model)
 
             return {
                 "status": "healthy",
@@ -204,3 +565,15 @@ class AIAgent:
                 "model_available": False,
                 "error": str(e)
             }
+
+    async def clear_conversation(self, conversation_id: str) -> bool:
+        return await self.conversations.adelete(conversation_id)
+
+    async def get_conversation_history(self, conversation_id: str):
+        messages = await self.conversations.aget(conversation_id)
+        if messages is None:
+            return None
+        return [
+            {"role": msg.role, "content": msg.content}
+            for msg in messages
+        ]
@@ -0,0 +1,199 @@
+"""
+Text extraction for uploaded documents, with multi-core PDF support
+"""
+
+import io
+import multiprocessing
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional
+
+# Below this many pages a process pool costs more to start than it saves
+PARALLEL_MIN_PAGES = 48
+
+# Each worker process parses a PDF once and keeps (path, reader) here
+_worker_reader = None
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    global _worker_reader
+    if _worker_reader is None or _worker_reader[0] != path:
+        import pypdf
+        with open(path, "rb") as f:
+            _worker_reader = (path, pypdf.PdfReader(io.BytesIO(f.read())))
+    reader = _worker_reader[1]
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+class PdfExtractPool:
+    """
+    Worker processes for PDF extraction, shared by every document of a run
+
+    Workers are started with "spawn", never "fork": extraction is called
+    from ingestion threads inside a process that also runs uvicorn and
+    torch, and forking a multithreaded process can deadlock. Spawned
+    workers are slow to start, so the pool is created on first use and
+    reused until close().
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self) -> "PdfExtractPool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_pdf_pages(
+    file_content: bytes,
+    workers: Optional[int] = None,
+    pages_per_task: Optional[int] = None,
+    pool: Optional[PdfExtractPool] = None
+) -> Iterator[str]:
+    """
+    Yield the text of each PDF page, in page order, as it becomes available
+
+    Large PDFs are split into page ranges extracted by a process pool. The
+    file is written to a temporary path once and each worker parses it
+    once, on its first range. Ranges are several times smaller than
+    pages/workers so a slow range does not leave the other cores idle, and
+    the first pages are yielded as soon as their range is done. Stopping
+    early cancels the remaining ranges.
+
+    Args:
+        file_content: Raw PDF bytes
+        workers: Process count (default: all cores, or the pool's size); 1
+            extracts in-process
+        pages_per_task: Pages per range (default: about 4 ranges per worker)
+        pool: Pool to reuse; without one, a pool is started for this file
+    """
+    import pypdf
+
+    reader = pypdf.PdfReader(io.BytesIO(file_content))
+    page_count = len(reader.pages)
+    if workers is None:
+        workers = pool.workers if pool is not None else os.cpu_count() or 1
+    workers = min(workers, page_count or 1)
+
+    if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    own_pool = pool is None
+    if own_pool:
+        pool = PdfExtractPool(workers)
+
+    step = pages_per_task or max(1, -(-page_count // (workers * 4)))
+    # A fresh name per file, since workers cache their reader by path
+    with tempfile.NamedTemporaryFile(prefix=f"{uuid.uuid4().hex}-", suffix=".pdf", delete=False) as f:
+        f.write(file_content)
+    futures = []
+    try:
+        executor = pool.executor()
+        futures = [
+            executor.submit(_extract_page_range, f.name, start, min(start + step, page_count))
+            for start in range(0, page_count, step)
+        ]
+        for future in futures:
+            yield from future.result()
+    except BrokenProcessPool:
+        # A worker died; let the next file start a fresh pool
+        pool.close()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+        # Ranges that are already running still read the file
+        wait(futures)
+        if own_pool:
+            pool.close()
+        os.unlink(f.name)
+
+
+def iter_docx_paragraphs(file_content: bytes) -> Iterator[str]:
+    import docx
+
+    for para in docx.Document(io.BytesIO(file_content)).paragraphs:
+        yield para.text
+
+
+def iter_file_text(
+    file_content: bytes,
+    filename: str,
+    workers: Optional[int] = None,
+    pool: Optional[PdfExtractPool] = None
+) -> Iterator[str]:
+    """
+    Stream a document's text in pieces (pages, paragraphs or the whole file)
+
+    Unsupported extensions yield nothing.
+    """
+    filename = filename.lower()
+
+    if filename.endswith('.pdf'):
+        yield from iter_pdf_pages(file_content, workers=workers, pool=pool)
+    elif filename.endswith('.docx'):
+        yield from iter_docx_paragraphs(file_content)
+    elif filename.endswith('.txt') or filename.endswith('.md'):
+        yield file_content.decode('utf-8', errors='ignore')
+
+
+def extract_text(
+    file_content: bytes,
+    filename: str,
+    workers: Optional[int] = None,
+    pool: Optional[PdfExtractPool] = None
+) -> str:
+    """
+    Extract text from file content based on extension
+
+    Raises:
+        ValueError: the extension is not supported
+        Any error from the parser or the PDF process pool
+    """
+    lower = filename.lower()
+
+    if lower.endswith('.txt') or lower.endswith('.md'):
+        return file_content.decode('utf-8', errors='ignore')
+    if not (lower.endswith('.pdf') or lower.endswith('.docx')):
+        raise ValueError(f"Unsupported file type: {filename}")
+
+    # One newline after every page/paragraph, joined once instead of
+    # growing a string piece by piece
+    pieces = list(iter_file_text(file_content, lower, workers=workers, pool=pool))
+    pieces.append("")
+    return "\n".join(pieces)
+
+
+def process_file_content(
+    file_content: bytes,
+    filename: str,
+    workers: Optional[int] = None,
+    pool: Optional[PdfExtractPool] = None
+) -> str:
+    """Extract text from file content based on extension; "" on any error"""
+    try:
+        return extract_text(file_content, filename, workers=workers, pool=pool)
+    except Exception as e:
+        print(f"Error processing file {filename}: {e}")
+        return ""
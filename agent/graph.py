@@ -1,14 +1,25 @@
-from typing import TypedDict, Annotated, Sequence, Union, Dict, Any
+from typing import TypedDict, Annotated, Sequence, Union, Dict, Any, Optional
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
+from langchain_core.utils.function_calling import convert_to_openai_tool
 from langchain_ollama import ChatOllama
+from agent.admission import AdmissionController, AdmissionRejected
+from agent.cache import ResponseCache, context_hash
+from agent.context import ContextBuilder, DEFAULT_CONTEXT_TOKENS, estimate_tokens
+from agent.locks import ConversationLocks
+from agent.memory import ConversationStore, InMemoryConversationStore
+from agent.search import web_search
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, nullcontext
+import asyncio
+import functools
 import operator
+import uuid
 import datetime
 import json
-import httpx
-import re
 
 # Define the State
 class AgentState(TypedDict):
@@ -33,48 +44,67 @@ def calculate(expression: str) -> str:
         return f"Calculation error: {str(e)}"
 
 @tool
-def search_web(query: str, max_results: int = 5) -> str:
+async def search_web(query: str, max_results: int = 5) -> str:
     """Search the web for real-time information using DuckDuckGo"""
-    try:
-        url = "https://html.duckduckgo.com/html/"
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
-        with httpx.Client(timeout=10.0) as client:
-            response = client.post(url, data={"q": query}, headers=headers, follow_redirects=True)
-            if response.status_code != 200:
-                return f"Search failed with status code: {response.status_code}"
-            
-            # Simple cleanup of HTML
-            html = response.text
-            result_pattern = r'result__a.*?href="(.*?)".*?>(.*?)</a>.*?result__snippet.*?>(.*?)</span'
-            matches = re.findall(result_pattern, html, re.DOTALL)
-            
-            results = []
-            for i, (link, title, snippet) in enumerate(matches[:max_results]):
-                title = re.sub(r'<.*?>', '', title).strip()
-                snippet = re.sub(r'<.*?>', '', snippet).strip()
-                results.append(f"{i+1}. **{title}**\n   {snippet}\n   URL: {link}\n")
-            
-            if not results:
-                return f"No results found for: {query}"
-            return "\n".join(results)
-    except Exception as e:
-        return f"Search error: {str(e)}"
+    return await web_search.search(query, max_results)
 
 TOOLS = [get_current_time, calculate, search_web]
 
+# Message codec for durable conversation stores
+def encode_message(message: BaseMessage) -> str:
+    return json.dumps(message_to_dict(message))
+
+def decode_message(payload: str) -> BaseMessage:
+    return messages_from_dict([json.loads(payload)])[0]
+
 # Define Graph Class
 class LangGraphAgent:
-    def __init__(self, model_name: str = "phi3:latest"):
-        self.model = ChatOllama(model=model_name, temperature=0.7)
+    def __init__(
+        self,
+        model_name: str = "phi3:latest",
+        base_url: Optional[str] = None,
+        client_kwargs: Optional[Dict[str, Any]] = None,
+        store: Optional[ConversationStore] = None,
+        context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+        keep_alive: Optional[str] = "30m",
+        response_cache: Optional[ResponseCache] = None,
+        tool_timeout: float = 15.0,
+        tool_timeouts: Optional[Dict[str, float]] = None,
+        tool_workers: int = 4,
+        admission: Optional[AdmissionController] = None
+    ):
+        # ChatOllama keeps one AsyncClient per instance; client_kwargs sizes its pool
+        self.model = ChatOllama(
+            model=model_name,
+            temperature=0.7,
+            base_url=base_url,
+            keep_alive=keep_alive,
+            client_kwargs=client_kwargs or {}
+        )
         self.model = self.model.bind_tools(TOOLS)
         self.tools = {t.name: t for t in TOOLS}
-        self.tool_node = ToolNode(TOOLS)
+        self.response_cache = response_cache
+        # Bounds concurrent generations on the Ollama server, per model call
+        self.admission = admission
+        self.context = ContextBuilder(max_tokens=context_tokens)
+        # Bound tool schemas are sent with every request and count against the window
+        self._tool_schema_tokens = estimate_tokens(
+            json.dumps([convert_to_openai_tool(t) for t in TOOLS])
+        )
+        # Per-call timeouts (seconds), overridable per tool name
+        self.tool_timeout = tool_timeout
+        self.tool_timeouts = tool_timeouts or {}
+        # Sync tools run here instead of on the event loop; bounded so a burst
+        # of tool calls cannot spawn unbounded threads
+        self._tool_executor = ThreadPoolExecutor(
+            max_workers=tool_workers, thread_name_prefix="tool"
+        )
         
         # Build graph
         workflow = StateGraph(AgentState)
         
-        workflow.add_node("agent", self.call_model)
-        workflow.add_node("tools", self.tool_node)
+        workflow.add_node("agent", self.acall_model)
+        workflow.add_node("tools", self.acall_tools)
         
         workflow.set_entry_point("agent")
         
@@ -87,13 +117,67 @@ class LangGraphAgent:
         workflow.add_edge("tools", "agent")
         
         self.app = workflow.compile()
-        self.conversations = {}
+        # Message lists per conversation, bounded by the store's eviction policy
+        self.conversations: ConversationStore = (
+            store if store is not None else InMemoryConversationStore()
+        )
+        # Turns of one conversation run one at a time
+        self.conversation_locks = ConversationLocks()
 
-    def call_model(self, state: AgentState):
-        messages = state['messages']
-        response = self.model.invoke(messages)
+    def _context_window(self, messages):
+        """Newest messages that fit the token budget, never opening on a tool result"""
+        return self.context.select(
+            messages,
+            reserved_tokens=self._tool_schema_tokens,
+            can_start=lambda m: not isinstance(m, ToolMessage)
+        )
+
+    async def acall_model(self, state: AgentState):
+        """Async agent node: awaits Ollama without blocking the event loop"""
+        messages = self._context_window(state['messages'])
+        # The admission slot covers the model call only, not the tool node
+        async with self.admission.slot() if self.admission is not None else nullcontext():
+            response = await self.model.ainvoke(messages)
         return {"messages": [response]}
 
+    async def _run_tool_call(self, call: Dict[str, Any], config: RunnableConfig) -> ToolMessage:
+        """Run one tool call with its own timeout; failures become error ToolMessages"""
+        name = call["name"]
+        tool_ = self.tools.get(name)
+        timeout = self.tool_timeouts.get(name, self.tool_timeout)
+        
+        if tool_ is None:
+            content = f"Error: Tool '{name}' not found"
+        else:
+            try:
+                if tool_.coroutine is not None:
+                    # I/O-bound async tools (search_web) run on the event loop
+                    output = await asyncio.wait_for(tool_.ainvoke(call["args"], config), timeout)
+                else:
+                    loop = asyncio.get_running_loop()
+                    output = await asyncio.wait_for(
+                        loop.run_in_executor(
+                            self._tool_executor,
+                            functools.partial(tool_.invoke, call["args"], config)
+                        ),
+                        timeout
+                    )
+                content = str(output)
+            except asyncio.TimeoutError:
+                content = f"Error: Tool '{name}' timed out after {timeout}s"
+            except Exception as e:
+                content = f"Error executing tool: {str(e)}"
+        
+        return ToolMessage(content=content, tool_call_id=call["id"], name=name)
+
+    async def acall_tools(self, state: AgentState, config: RunnableConfig):
+        """Tool node: run every tool call of the last message concurrently, in call order"""
+        last_message = state['messages'][-1]
+        results = await asyncio.gather(
+            *(self._run_tool_call(call, config) for call in last_message.tool_calls)
+        )
+        return {"messages": list(results)}
+
     def should_continue(self, state: AgentState):
         messages = state['messages']
         last_message = messages[-1]
@@ -102,29 +186,85 @@ class LangGraphAgent:
             return "continue"
         return "end"
 
-    async def chat(self, user_message: str, conversation_id: str = None) -> Dict[str, Any]:
-        """Chat interface compatible with existing system"""
+    async def _prepare_inputs(self, user_message: str, conversation_id: str = None):
+        """Resolve the conversation and build the graph input for a new turn"""
         if not conversation_id:
-            import uuid
             conversation_id = str(uuid.uuid4())
             
-        if conversation_id not in self.conversations:
-            self.conversations[conversation_id] = []
-            
-        # Add user message to history if it's new
-        # Note: LangGraph manages state per invocation usually, but here we want persistence
-        # We will use the conversation_id to retrieve history, simplistic in-memory approach
-        
-        current_messages = self.conversations.get(conversation_id, [])
+        # LangGraph manages state per invocation, so history is replayed from the store
+        # and only the messages produced by this turn are written back
+        history = await self.conversations.aget(conversation_id) or []
+        current_messages = list(history)
         current_messages.append(HumanMessage(content=user_message))
         
-        inputs = {"messages": current_messages}
+        return conversation_id, {"messages": current_messages}
+
+    def _save_turn(self, conversation_id: str, inputs, final_messages):
+        """
+        Append the user message and everything the graph produced for it
+
+        Only called once the graph has finished, so a failed or cancelled
+        turn leaves nothing in the store.
+        """
+        new_messages = final_messages[len(inputs["messages"]) - 1:]
+        self.conversations.append(conversation_id, new_messages)
+
+    async def _cached_response(self, conversation_id: str, inputs):
+        """Serve the turn from the response cache; returns None on a miss"""
+        if self.response_cache is None:
+            return None
+        
+        *history, question = inputs["messages"]
+        cached = await self.response_cache.lookup(
+            question.content, context_hash((m.type, m.content) for m in history)
+        )
+        if cached is not None:
+            self.conversations.append(conversation_id, [question, AIMessage(content=cached)])
+        return cached
+
+    async def _cache_response(self, inputs, final_messages):
+        if self.response_cache is None:
+            return
+        
+        *history, question = inputs["messages"]
+        new_messages = final_messages[len(inputs["messages"]):]
+        await self.response_cache.store(
+            question.content,
+            context_hash((m.type, m.content) for m in history),
+            final_messages[-1].content,
+            tools_used=[m.name for m in new_messages if isinstance(m, ToolMessage)]
+        )
+
+    def _metadata(self, messages) -> Dict[str, Any]:
+        return {
+            "model": self.model.model,
+            "tool_calls": len([m for m in messages if isinstance(m, ToolMessage)])
+        }
+
+    async def chat(self, user_message: str, conversation_id: str = None) -> Dict[str, Any]:
+        """Chat interface compatible with existing system"""
+        conversation_id = conversation_id or str(uuid.uuid4())
+        async with self.conversation_locks.hold(conversation_id):
+            return await self._chat(user_message, conversation_id)
+    
+    async def _chat(self, user_message: str, conversation_id: str) -> Dict[str, Any]:
+        conversation_id, inputs = await self._prepare_inputs(user_message, conversation_id)
+        
+        cached = await self._cached_response(conversation_id, inputs)
+        if cached is not None:
+            return {
+                "response": cached,
+                "conversation_id": conversation_id,
+                "timestamp": datetime.datetime.now(),
+                "metadata": {"model": self.model.model, "tool_calls": 0, "cached": True}
+            }
         
         # Execute graph
         final_state = await self.app.ainvoke(inputs)
         
         # Update history
-        self.conversations[conversation_id] = final_state['messages']
+        self._save_turn(conversation_id, inputs, final_state['messages'])
+        await self._cache_response(inputs, final_state['messages'])
         
         # Extract last response
         last_message = final_state['messages'][-1]
@@ -134,17 +274,111 @@ class LangGraphAgent:
             "response": response_text,
             "conversation_id": conversation_id,
             "timestamp": datetime.datetime.now(),
-            "metadata": {
+            "metadata": self._metadata(final_state['messages'])
+        }
+    
+    async def stream_events(self, user_message: str, conversation_id: str = None):
+        """
+        Stream typed events out of the compiled graph as they happen
+        
+        Yields dicts with a "type" key:
+            token:      {"content"} - a model token as soon as Ollama emits it
+            tool_start: {"tool", "input"} - a tool call is about to run
+            tool_end:   {"tool", "output"} - a tool call finished
+            metadata:   {"conversation_id", "model", "tool_calls"} - once, at the end
+            error:      {"message"} - generation failed; rejections by the
+                        admission queue add "status_code" and "retry_after"
+        """
+        conversation_id = conversation_id or str(uuid.uuid4())
+        async with self.conversation_locks.hold(conversation_id):
+            events = self._stream_events(user_message, conversation_id)
+            async with aclosing(events):
+                async for event in events:
+                    yield event
+    
+    async def _stream_events(self, user_message: str, conversation_id: str):
+        conversation_id, inputs = await self._prepare_inputs(user_message, conversation_id)
+        final_state = None
+        
+        cached = await self._cached_response(conversation_id, inputs)
+        if cached is not None:
+            yield {"type": "token", "content": cached}
+            yield {
+                "type": "metadata",
+                "conversation_id": conversation_id,
                 "model": self.model.model,
-                "tool_calls": len([m for m in final_state['messages'] if isinstance(m, ToolMessage)])
+                "tool_calls": 0,
+                "cached": True
             }
+            return
+        
+        try:
+            async for event in self.app.astream_events(inputs, version="v2"):
+                kind = event["event"]
+                
+                if kind == "on_chat_model_stream":
+                    content = event["data"]["chunk"].content
+                    # Chunks that only carry tool_call deltas have no text
+                    if content:
+                        yield {"type": "token", "content": content}
+                
+                elif kind == "on_tool_start":
+                    yield {
+                        "type": "tool_start",
+                        "tool": event["name"],
+                        "input": event["data"].get("input")
+                    }
+                
+                elif kind == "on_tool_end":
+                    output = event["data"].get("output")
+                    yield {
+                        "type": "tool_end",
+                        "tool": event["name"],
+                        "output": str(getattr(output, "content", output))
+                    }
+                
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    # The root run finishing carries the final graph state
+                    final_state = event["data"].get("output")
+        
+        except AdmissionRejected as e:
+            yield e.as_event()
+            return
+        
+        except Exception as e:
+            yield {"type": "error", "message": str(e)}
+            return
+        
+        if final_state and final_state.get("messages"):
+            self._save_turn(conversation_id, inputs, final_state["messages"])
+            await self._cache_response(inputs, final_state["messages"])
+            messages = final_state["messages"]
+        else:
+            messages = inputs["messages"]
+        
+        yield {
+            "type": "metadata",
+            "conversation_id": conversation_id,
+            **self._metadata(messages)
         }
     
     async def chat_stream(self, user_message: str, conversation_id: str = None):
-        """Streaming chat interface"""
-        # Simplistic streaming wrapper around chat
-        result = await self.chat(user_message, conversation_id)
-        yield result["response"]
+        """Streaming chat interface yielding model tokens as they arrive"""
+        async for event in self.stream_events(user_message, conversation_id):
+            if event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "error":
+                yield f"Error: {event['message']}"
+    
+    async def warm_up(self):
+        """
+        Load the model and prompt-evaluate the bound tool schemas ahead of traffic
+
+        This agent sends no system prompt, so the tool schemas are the shared
+        prefix of every request. Generates a single token, as AIAgent.warm_up
+        does, so startup does not wait for a full answer.
+        """
+        await self.model.bind(options={"num_predict": 1}).ainvoke([HumanMessage(content="Hi")])
     
     async def health_check(self):
         try:
@@ -158,14 +392,12 @@ class LangGraphAgent:
         except Exception as e:
             return {"status": "unhealthy", "error": str(e)}
 
-    def clear_conversation(self, conversation_id: str) -> bool:
-        if conversation_id in self.conversations:
-            del self.conversations[conversation_id]
-            return True
-        return False
+    async def clear_conversation(self, conversation_id: str) -> bool:
+        return await self.conversations.adelete(conversation_id)
         
-    def get_conversation_history(self, conversation_id: str):
-        if conversation_id in self.conversations:
+    async def get_conversation_history(self, conversation_id: str):
+        messages = await self.conversations.aget(conversation_id)
+        if messages is not None:
             return [{"role": "user" if isinstance(m, HumanMessage) else "assistant", "content": m.content} 
-                    for m in self.conversations[conversation_id] if not isinstance(m, ToolMessage) and (isinstance(m, HumanMessage) or isinstance(m, AIMessage))]
+                    for m in messages if not isinstance(m, ToolMessage) and (isinstance(m, HumanMessage) or isinstance(m, AIMessage))]
         return None
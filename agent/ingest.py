@@ -0,0 +1,351 @@
+"""
+Streaming, resumable document ingestion for the RAG engine
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from agent.extract import PdfExtractPool, extract_text
+from agent.manifest import IngestManifest, chunk_metadata, content_hash, normalize_text
+
+# A file path, or an already extracted (source, text) pair
+IngestItem = Union[str, Path, Tuple[str, str]]
+
+DEFAULT_BATCH_SIZE = 64
+# Manifest and checkpoint are rewritten after this many finished documents
+# or seconds, whichever comes first, and once when the run ends
+DEFAULT_SAVE_EVERY = 100
+DEFAULT_SAVE_INTERVAL = 5.0
+
+_DONE = object()
+
+
+class IngestCheckpoint:
+    """
+    Sources that are fully ingested, persisted as JSON
+
+    mark() only updates memory; the pipeline calls save() periodically and
+    when a run ends. Each save rewrites the file atomically, so an
+    interrupted run resumes after the last saved document.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.done: Set[str] = set()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = set(json.load(f).get("done", []))
+
+    def __contains__(self, source: str) -> bool:
+        return source in self.done
+
+    def mark(self, sources: Iterable[str]):
+        self.done.update(sources)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"done": sorted(self.done)}, f)
+        os.replace(tmp, self.path)
+
+
+class IngestProgress:
+    """Counters reported after every upserted batch"""
+
+    def __init__(self, total: Optional[int] = None):
+        self.total = total
+        self.skipped = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.documents = 0
+        self.chunks = 0
+        self.reused_chunks = 0
+        self.moved_chunks = 0
+        self.deleted_chunks = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "documents": self.documents,
+            "total": self.total,
+            "skipped": self.skipped,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "chunks": self.chunks,
+            "reused_chunks": self.reused_chunks,
+            "moved_chunks": self.moved_chunks,
+            "deleted_chunks": self.deleted_chunks,
+            "batches": self.batches,
+            "seconds": round(elapsed, 2),
+            "docs_per_second": round(self.documents / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": round(self.chunks / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+class IngestPipeline:
+    """
+    extract -> chunk -> embed -> upsert, one thread per stage
+
+    Stages are connected by bounded queues, so extraction of the next file,
+    embedding of the current batch and the Chroma write all overlap while
+    at most `queue_size` items wait between any two stages. Chunks are
+    embedded and upserted in fixed batches of `batch_size` regardless of
+    document size: a 500-page PDF becomes many small batches, and many
+    small files share batches.
+
+    Chunk ids are content hashes (see agent.manifest), so re-running after
+    a crash overwrites partial writes. With a `manifest`, sources whose
+    content is unchanged are skipped before extraction, and a changed
+    source only embeds its new chunks, updates the position metadata of
+    kept chunks that moved, and deletes the ones it lost. With a
+    `checkpoint_path`, documents that finished in an earlier run are
+    skipped by name. Large PDFs are extracted by one process pool of
+    `pdf_workers` (default: all cores), started on first use and shared by
+    every file of the run. A file that cannot be read or yields no text is
+    counted as failed and left as stored, to be retried by the next run.
+
+    The manifest and checkpoint are saved every `save_every` documents or
+    `save_interval` seconds, and once at the end even if the run fails. A
+    process killed in between re-ingests at most those documents, which the
+    content-hashed ids make harmless.
+    """
+
+    def __init__(
+        self,
+        engine,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        queue_size: int = 4,
+        checkpoint_path: Optional[str] = None,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        manifest: Optional[IngestManifest] = None,
+        pdf_workers: Optional[int] = None,
+        save_every: int = DEFAULT_SAVE_EVERY,
+        save_interval: float = DEFAULT_SAVE_INTERVAL
+    ):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.checkpoint = IngestCheckpoint(checkpoint_path)
+        self.on_progress = on_progress
+        self.manifest = manifest if manifest is not None else IngestManifest()
+        self.pdf_workers = pdf_workers
+        self.save_every = save_every
+        self.save_interval = save_interval
+
+    def _extract(self, item: IngestItem, pdf_pool: PdfExtractPool) -> Optional[Tuple[str, str, str]]:
+        """
+        (source, text, content hash), or None if the stored version is current
+
+        Raises:
+            Any read or extraction error, and ValueError when a non-empty
+            file yields no text. Recording that as an empty version would
+            delete the stored chunks and mark the file unchanged for good.
+        """
+        if isinstance(item, tuple):
+            source, text = item
+            digest = content_hash(normalize_text(text))
+            if self.manifest.unchanged(source, digest):
+                return None
+            return source, text, digest
+
+        path = Path(item)
+        data = path.read_bytes()
+        # Hash the raw file so unchanged files are not even parsed
+        digest = content_hash(data)
+        if self.manifest.unchanged(str(path), digest):
+            return None
+        text = extract_text(data, path.name, pool=pdf_pool)
+        if data and not text.strip():
+            raise ValueError("no text could be extracted")
+        return str(path), text, digest
+
+    def run(self, items: Iterable[IngestItem]) -> Dict[str, Any]:
+        """
+        Ingest every item, blocking until done
+
+        Args:
+            items: File paths and/or (source, text) pairs; may be a generator
+
+        Returns:
+            Final progress snapshot
+
+        Raises:
+            The first exception raised by any stage
+        """
+        progress = IngestProgress(len(items) if hasattr(items, "__len__") else None)
+        texts: queue.Queue = queue.Queue(self.queue_size)
+        batches: queue.Queue = queue.Queue(self.queue_size)
+        embedded: queue.Queue = queue.Queue(self.queue_size)
+        stop = threading.Event()
+        errors: List[BaseException] = []
+        pdf_pool = PdfExtractPool(self.pdf_workers)
+        # Documents recorded since the manifest and checkpoint were last written
+        unsaved = 0
+        last_saved = time.monotonic()
+
+        def save():
+            nonlocal unsaved, last_saved
+            if unsaved:
+                self.manifest.save()
+                self.checkpoint.save()
+            unsaved = 0
+            last_saved = time.monotonic()
+
+        def put(q: queue.Queue, value) -> bool:
+            # Bounded put that gives up once another stage has failed
+            while not stop.is_set():
+                try:
+                    q.put(value, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q: queue.Queue):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def stage(target):
+            def runner():
+                try:
+                    target()
+                except BaseException as e:
+                    errors.append(e)
+                    stop.set()
+            return threading.Thread(target=runner, daemon=True)
+
+        def extract():
+            for item in items:
+                if stop.is_set():
+                    return
+                source = item[0] if isinstance(item, tuple) else str(Path(item))
+                if source in self.checkpoint:
+                    progress.skipped += 1
+                    continue
+                try:
+                    extracted = self._extract(item, pdf_pool)
+                except Exception as e:
+                    # Left out of the manifest and the checkpoint, so the
+                    # stored version stays and the next run retries it
+                    print(f"Error extracting {source}: {e}")
+                    progress.failed += 1
+                    continue
+                if extracted is None:
+                    progress.unchanged += 1
+                    continue
+                if not put(texts, extracted):
+                    return
+            put(texts, _DONE)
+
+        def chunk():
+            ids, documents, metadatas, updates, completes = [], [], [], [], []
+
+            def flush() -> bool:
+                nonlocal ids, documents, metadatas, updates, completes
+                ok = put(batches, (ids, documents, metadatas, updates, completes))
+                ids, documents, metadatas, updates, completes = [], [], [], [], []
+                return ok
+
+            while True:
+                item = get(texts)
+                if item is _DONE:
+                    break
+                source, text, digest = item
+                chunks = self.engine._chunk_text(text) if text else []
+                placed, fresh, moved, stale = self.manifest.plan(source, chunks)
+                progress.reused_chunks += len(placed) - len(fresh)
+                for cid, i, piece, start, end in fresh:
+                    ids.append(cid)
+                    documents.append(piece)
+                    metadatas.append(chunk_metadata(source, i, start, end))
+                    if len(ids) + len(updates) >= self.batch_size and not flush():
+                        return
+                # Kept chunks that moved only need their metadata rewritten
+                for cid, i, start, end in moved:
+                    updates.append((cid, chunk_metadata(source, i, start, end)))
+                    if len(ids) + len(updates) >= self.batch_size and not flush():
+                        return
+                # Batches are written in order, so a document is complete once
+                # the batch holding its last chunk is
+                completes.append((source, digest, placed, stale))
+            if (ids or updates or completes) and not flush():
+                return
+            put(batches, _DONE)
+
+        def embed():
+            while True:
+                batch = get(batches)
+                if batch is _DONE:
+                    break
+                ids, documents, metadatas, updates, completes = batch
+                embeddings = self.engine.embedding_fn(documents) if documents else []
+                if not put(embedded, (ids, documents, metadatas, updates, completes, embeddings)):
+                    return
+            put(embedded, _DONE)
+
+        threads = [stage(extract), stage(chunk), stage(embed)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            collection = self.engine.collection
+            while True:
+                batch = get(embedded)
+                if batch is _DONE:
+                    break
+                ids, documents, metadatas, updates, completes, embeddings = batch
+                if ids:
+                    collection.upsert(
+                        ids=ids,
+                        documents=documents,
+                        metadatas=metadatas,
+                        embeddings=[list(map(float, e)) for e in embeddings]
+                    )
+                if updates:
+                    collection.update(
+                        ids=[cid for cid, _ in updates],
+                        metadatas=[metadata for _, metadata in updates]
+                    )
+                    progress.moved_chunks += len(updates)
+                for source, digest, placed, stale in completes:
+                    # Only once the new version is fully written
+                    if stale:
+                        collection.delete(ids=sorted(stale))
+                        progress.deleted_chunks += len(stale)
+                    self.manifest.record(source, digest, placed)
+                self.checkpoint.mark(source for source, _, _, _ in completes)
+                unsaved += len(completes)
+                if unsaved >= self.save_every or time.monotonic() - last_saved >= self.save_interval:
+                    save()
+
+                progress.documents += len(completes)
+                progress.chunks += len(ids)
+                progress.batches += 1
+                if self.on_progress is not None:
+                    self.on_progress(progress.snapshot())
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            pdf_pool.close()
+            # Everything recorded was fully written, even if the run failed
+            save()
+
+        if errors:
+            raise errors[0]
+        return progress.snapshot()
@@ -0,0 +1,41 @@
+"""
+Per-conversation request serialization
+"""
+
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+
+class ConversationLocks:
+    """
+    One asyncio.Lock per conversation id, created on demand
+
+    Turns of the same conversation run one at a time, so two requests can
+    neither read the same history nor interleave their appends; different
+    conversations never wait on each other. Locks are held weakly: a lock
+    exists only while a request holds or waits on it, so evicted (and idle)
+    conversations leave nothing behind.
+    """
+
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = (
+            weakref.WeakValueDictionary()
+        )
+        self.contended = 0
+
+    @asynccontextmanager
+    async def hold(self, conversation_id: str):
+        lock = self._locks.get(conversation_id)
+        if lock is None:
+            lock = self._locks[conversation_id] = asyncio.Lock()
+        if lock.locked():
+            self.contended += 1
+
+        # Uncontended acquire returns without yielding to the event loop
+        async with lock:
+            yield
+
+    def stats(self) -> Dict[str, Any]:
+        return {"active": len(self._locks), "contended": self.contended}
@@ -0,0 +1,117 @@
+"""
+Content-addressed chunk ids and the per-source ingestion manifest
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so re-extracted or re-wrapped text hashes the same"""
+    return " ".join(text.split())
+
+
+def content_hash(data: Union[str, bytes]) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def source_key(source: str) -> str:
+    """Short, stable id for a source; also the prefix of its chunk ids"""
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_id(source: str, text: str) -> str:
+    """Same source and same normalized text always give the same id"""
+    digest = hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()[:24]
+    return f"{source_key(source)}-{digest}"
+
+
+def chunk_metadata(source: str, index: int, start: int, end: int) -> Dict[str, Union[str, int]]:
+    """Metadata stored with each chunk: its source and position in the text"""
+    return {"source": source, "chunk_index": index, "start": start, "end": end}
+
+
+class IngestManifest:
+    """
+    What is stored for each source: a content hash and its chunk ids
+
+    Kept as JSON next to the Chroma files (so wiping the store also wipes
+    the manifest). A source whose content hash is unchanged is skipped
+    before extraction; a changed one only embeds chunks whose ids are new,
+    updates the position metadata of kept chunks that moved, and deletes
+    the ids it no longer produces.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.sources: Dict[str, Dict] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.sources = json.load(f).get("sources", {})
+
+    def unchanged(self, source: str, digest: str) -> bool:
+        entry = self.sources.get(source)
+        return entry is not None and entry["content_hash"] == digest
+
+    def plan(self, source: str, chunks: List[Tuple[str, int, int]]) -> Tuple[List[tuple], List[tuple], List[tuple], Set[str]]:
+        """
+        Decide what to write for a new version of a source
+
+        Args:
+            source: Document source name
+            chunks: (chunk, start, end) from the chunker
+
+        Returns:
+            Tuple of (id, index, start, end) for every chunk of this version,
+            (id, index, chunk, start, end) for chunks not stored yet,
+            (id, index, start, end) for stored chunks whose position
+            changed (their metadata needs updating, not re-embedding),
+            and the ids to delete
+        """
+        entry = self.sources.get(source, {})
+        previous = entry.get("chunks", ())
+        # Manifests written before spans were recorded: every position is unknown
+        spans = entry.get("spans") or [None] * len(previous)
+        stored = {cid: tuple(span) if span else None for cid, span in zip(previous, spans)}
+
+        placed: List[tuple] = []
+        fresh: List[tuple] = []
+        moved: List[tuple] = []
+        seen: Set[str] = set()
+
+        for index, (chunk, start, end) in enumerate(chunks):
+            cid = chunk_id(source, chunk)
+            if cid in seen:
+                # Repeated boilerplate inside one document is stored once
+                continue
+            seen.add(cid)
+            placed.append((cid, index, start, end))
+            if cid not in stored:
+                fresh.append((cid, index, chunk, start, end))
+            elif stored[cid] != (index, start, end):
+                moved.append((cid, index, start, end))
+
+        return placed, fresh, moved, set(stored) - seen
+
+    def record(self, source: str, digest: str, placed: List[tuple]):
+        """Remember a version once it is fully written; placed comes from plan()"""
+        self.sources[source] = {
+            "content_hash": digest,
+            "chunks": [cid for cid, _, _, _ in placed],
+            "spans": [[index, start, end] for _, index, start, end in placed],
+        }
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"sources": self.sources}, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,225 @@
+"""
+Conversation stores with bounded memory
+
+Both agents keep each conversation as a plain list of message objects
+(models.schemas.Message for AIAgent, LangChain BaseMessage for
+LangGraphAgent) and go through a ConversationStore instead of an
+unbounded dict.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+# Rough per-message overhead (object headers, role, timestamps) on top of content
+MESSAGE_OVERHEAD_BYTES = 200
+
+
+def estimate_message_size(message: Any) -> int:
+    """Approximate memory footprint of a message in bytes"""
+    content = getattr(message, "content", message)
+    if not isinstance(content, str):
+        content = str(content)
+    return len(content) + MESSAGE_OVERHEAD_BYTES
+
+
+class ConversationStore(ABC):
+    """Interface shared by all conversation backends"""
+
+    @abstractmethod
+    def get(self, conversation_id: str) -> Optional[List[Any]]:
+        """Return the message list of a conversation, or None if unknown"""
+
+    @abstractmethod
+    def create(self, conversation_id: str) -> List[Any]:
+        """Start an empty conversation and return its message list"""
+
+    @abstractmethod
+    def append(self, conversation_id: str, messages: Iterable[Any]) -> List[Any]:
+        """Append messages to a conversation (creating it if needed)"""
+
+    @abstractmethod
+    def delete(self, conversation_id: str) -> bool:
+        """Remove a conversation; returns False if it did not exist"""
+
+    @abstractmethod
+    def __contains__(self, conversation_id: str) -> bool:
+        ...
+
+    def get_or_create(self, conversation_id: str) -> List[Any]:
+        messages = self.get(conversation_id)
+        if messages is None:
+            messages = self.create(conversation_id)
+        return messages
+
+    # Event-loop variants. In-memory stores never block, so these just call
+    # the sync methods; disk-backed stores override them to read in a thread
+
+    async def aget(self, conversation_id: str) -> Optional[List[Any]]:
+        return self.get(conversation_id)
+
+    async def aget_or_create(self, conversation_id: str) -> List[Any]:
+        messages = await self.aget(conversation_id)
+        if messages is None:
+            messages = self.create(conversation_id)
+        return messages
+
+    async def adelete(self, conversation_id: str) -> bool:
+        return self.delete(conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class _Entry:
+    __slots__ = ("messages", "sizes", "size", "touched")
+
+    def __init__(self):
+        self.messages: List[Any] = []
+        self.sizes: List[int] = []
+        self.size = 0
+        self.touched = time.monotonic()
+
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    LRU + TTL conversation store with a per-conversation message cap
+    and a global memory budget
+
+    Eviction order: expired conversations first, then least recently
+    used ones until both the conversation limit and the memory budget
+    are respected. The conversation being written is never evicted by
+    its own write.
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = 1000,
+        ttl_seconds: Optional[float] = 24 * 3600,
+        max_messages: Optional[int] = 200,
+        memory_budget_bytes: Optional[int] = 64 * 1024 * 1024,
+        message_size: Callable[[Any], int] = estimate_message_size
+    ):
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.memory_budget_bytes = memory_budget_bytes
+        self.message_size = message_size
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._total_size = 0
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "evicted_lru": 0,
+            "evicted_ttl": 0,
+            "evicted_memory": 0,
+            "trimmed_messages": 0,
+        }
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl_seconds is not None and now - entry.touched > self.ttl_seconds
+
+    def _evict(self, conversation_id: str, reason: str):
+        entry = self._entries.pop(conversation_id)
+        self._total_size -= entry.size
+        self._counters[f"evicted_{reason}"] += 1
+
+    def _enforce_limits(self):
+        now = time.monotonic()
+
+        # Entries are kept in access order, so expired ones sit at the front
+        while self._entries:
+            oldest_id, oldest = next(iter(self._entries.items()))
+            if not self._expired(oldest, now):
+                break
+            self._evict(oldest_id, "ttl")
+
+        while len(self._entries) > self.max_conversations:
+            self._evict(next(iter(self._entries)), "lru")
+
+        if self.memory_budget_bytes is not None:
+            while self._total_size > self.memory_budget_bytes and len(self._entries) > 1:
+                self._evict(next(iter(self._entries)), "memory")
+
+    def _touch(self, conversation_id: str) -> Optional[_Entry]:
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+
+        now = time.monotonic()
+        if self._expired(entry, now):
+            self._evict(conversation_id, "ttl")
+            return None
+
+        entry.touched = now
+        self._entries.move_to_end(conversation_id)
+        return entry
+
+    def get(self, conversation_id: str) -> Optional[List[Any]]:
+        entry = self._touch(conversation_id)
+        if entry is None:
+            self._counters["misses"] += 1
+            return None
+        self._counters["hits"] += 1
+        return entry.messages
+
+    def create(self, conversation_id: str) -> List[Any]:
+        self.delete(conversation_id)
+        entry = _Entry()
+        self._entries[conversation_id] = entry
+        self._enforce_limits()
+        return entry.messages
+
+    def append(self, conversation_id: str, messages: Iterable[Any]) -> List[Any]:
+        entry = self._touch(conversation_id)
+        if entry is None:
+            self.create(conversation_id)
+            entry = self._entries[conversation_id]
+
+        for message in messages:
+            size = self.message_size(message)
+            entry.messages.append(message)
+            entry.sizes.append(size)
+            entry.size += size
+            self._total_size += size
+
+        if self.max_messages is not None and len(entry.messages) > self.max_messages:
+            excess = len(entry.messages) - self.max_messages
+            dropped = sum(entry.sizes[:excess])
+            # Trim in place so callers holding the list see the same object
+            del entry.messages[:excess]
+            del entry.sizes[:excess]
+            entry.size -= dropped
+            self._total_size -= dropped
+            self._counters["trimmed_messages"] += excess
+
+        self._enforce_limits()
+        return entry.messages
+
+    def delete(self, conversation_id: str) -> bool:
+        entry = self._entries.pop(conversation_id, None)
+        if entry is None:
+            return False
+        self._total_size -= entry.size
+        return True
+
+    def __contains__(self, conversation_id: str) -> bool:
+        entry = self._entries.get(conversation_id)
+        return entry is not None and not self._expired(entry, time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "conversations": len(self._entries),
+            "messages": sum(len(e.messages) for e in self._entries.values()),
+            "approx_bytes": self._total_size,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "max_conversations": self.max_conversations,
+            **self._counters,
+        }
@@ -0,0 +1,72 @@
+"""
+Shared, pooled async Ollama client
+"""
+
+import os
+from typing import Optional
+
+import httpx
+import ollama
+
+
+DEFAULT_OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+
+
+def client_kwargs(
+    max_connections: int = 16,
+    max_keepalive_connections: int = 8,
+    keepalive_expiry: float = 60.0,
+    connect_timeout: float = 5.0,
+    read_timeout: Optional[float] = 300.0
+) -> dict:
+    """
+    httpx pool and timeout settings for an Ollama client
+
+    Also usable as ChatOllama(client_kwargs=...).
+
+    Args:
+        max_connections: Upper bound on concurrent connections to Ollama
+        max_keepalive_connections: Idle connections kept open for reuse
+        keepalive_expiry: Seconds an idle connection stays in the pool
+        connect_timeout: Seconds to wait for a TCP connection
+        read_timeout: Seconds to wait between bytes (None disables it)
+
+    Returns:
+        Keyword arguments for httpx.AsyncClient
+    """
+    return {
+        "timeout": httpx.Timeout(read_timeout, connect=connect_timeout),
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+    }
+
+
+def create_async_client(host: Optional[str] = None, **pool_settings) -> ollama.AsyncClient:
+    """
+    Create an Ollama AsyncClient backed by one keep-alive connection pool
+
+    Every in-flight generation holds its own pooled connection, so a slow
+    generation only occupies one slot instead of stalling other requests.
+
+    Args:
+        host: Ollama base URL (defaults to $OLLAMA_HOST)
+        **pool_settings: See client_kwargs
+
+    Returns:
+        Configured ollama.AsyncClient
+    """
+    return ollama.AsyncClient(
+        host=host or DEFAULT_OLLAMA_HOST,
+        **client_kwargs(**pool_settings)
+    )
+
+
+async def close_async_client(client: ollama.AsyncClient) -> None:
+    """Close the connection pool behind an AsyncClient"""
+    # ollama.AsyncClient has no public close(); it wraps an httpx.AsyncClient
+    http_client = getattr(client, "_client", None)
+    if http_client is not None:
+        await http_client.aclose()
@@ -55,11 +55,21 @@ TOOL CALL FORMAT - When calling a tool, respond with ONLY this format (nothing e
 TOOL_CALL: tool_name
 PARAMETERS: {{"param1": "value1"}}
 
+If you need several tools that do not depend on each other's results, list
+all of them in the same response, one TOOL_CALL/PARAMETERS pair after another:
+TOOL_CALL: get_current_time
+PARAMETERS: {{}}
+TOOL_CALL: calculate
+PARAMETERS: {{"expression": "15 * 24"}}
+
+They run at the same time. If a call needs the result of another, make the
+first call now and the dependent one after its result comes back.
+
 DO NOT include any other text when calling a tool.
 DO NOT say "I'll check that" before the tool call.
 Just output the TOOL_CALL and PARAMETERS lines, nothing more.
 
-After the tool executes, provide a natural response incorporating the result."""
+After the tools execute, provide a natural response incorporating the results."""
 
 
 def get_conversation_prompt(messages: list) -> str:
@@ -1,37 +1,143 @@
-import chromadb
-from chromadb.utils import embedding_functions
-import uuid
-from typing import List, Dict, Any
+"""
+Retrieval-augmented generation over a local Chroma collection
+
+Nothing heavy happens at import time: chromadb, the SentenceTransformer
+model and the document parsers are loaded on first use, or ahead of time
+by RAGEngine.warm_up() (main.py runs it in the background at startup).
+"""
+
+import os
+import threading
+from typing import List, Dict, Any, Iterable, Tuple
+
+from agent.chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, chunk_text
+from agent.extract import process_file_content
+from agent.ingest import DEFAULT_BATCH_SIZE, IngestItem, IngestPipeline
+from agent.manifest import (
+    MANIFEST_FILENAME, IngestManifest, chunk_metadata, content_hash, normalize_text, source_key
+)
 
 PERSIST_DIRECTORY = "./chroma_db"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
 class RAGEngine:
-    def __init__(self):
-        self.client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
-        self.collection = self.client.get_or_create_collection(
-            name="documents",
-            embedding_function=self.embedding_fn
-        )
+    def __init__(
+        self,
+        persist_directory: str = PERSIST_DIRECTORY,
+        embedding_model: str = EMBEDDING_MODEL
+    ):
+        self.persist_directory = persist_directory
+        self.embedding_model = embedding_model
+        self._client = None
+        self._embedding_fn = None
+        self._manifest = None
+        self._collection = None
+        # Requests and the background warm-up may race to initialize
+        self._init_lock = threading.Lock()
+        self.ready = False
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._init_lock:
+                if self._client is None:
+                    import chromadb
+                    self._client = chromadb.PersistentClient(path=self.persist_directory)
+        return self._client
+
+    @property
+    def embedding_fn(self):
+        if self._embedding_fn is None:
+            with self._init_lock:
+                if self._embedding_fn is None:
+                    from chromadb.utils import embedding_functions
+                    self._embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
+                        model_name=self.embedding_model
+                    )
+        return self._embedding_fn
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            client, embedding_fn = self.client, self.embedding_fn
+            with self._init_lock:
+                if self._collection is None:
+                    self._collection = client.get_or_create_collection(
+                        name="documents",
+                        embedding_function=embedding_fn
+                    )
+        return self._collection
+
+    @property
+    def manifest(self) -> IngestManifest:
+        if self._manifest is None:
+            with self._init_lock:
+                if self._manifest is None:
+                    self._manifest = IngestManifest(
+                        os.path.join(self.persist_directory, MANIFEST_FILENAME)
+                    )
+        return self._manifest
+
+    def warm_up(self):
+        """
+        Open the store and load the embedding model ahead of the first request
 
-    def ingest(self, text: str, source: str) -> str:
+        Blocking; run it in a thread. One embedding call forces the model
+        weights to load, which is most of the cost.
+        """
+        self.embedding_fn(["warm up"])
+        self.collection
+        self.ready = True
+
+    def ingest(self, text: str, source: str, batch_size: int = DEFAULT_BATCH_SIZE) -> str:
         """
         Ingest text into the vector store.
-        Returns the ID of the inserted document.
+        Chunk ids are content hashes: re-ingesting an unchanged document is
+        a no-op, and a new version only embeds chunks that changed and
+        deletes the ones that are gone. New chunks are embedded and added
+        `batch_size` at a time.
+        Returns the ID of the document (stable per source).
         """
-        doc_id = str(uuid.uuid4())
-        chunks = self._chunk_text(text)
-        ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
-        metadatas = [{"source": source, "chunk_index": i} for i in range(len(chunks))]
+        digest = content_hash(normalize_text(text))
+        if self.manifest.unchanged(source, digest):
+            return source_key(source)
         
-        self.collection.add(
-            documents=chunks,
-            metadatas=metadatas,
-            ids=ids
-        )
-        return doc_id
+        placed, fresh, moved, stale = self.manifest.plan(source, self._chunk_text(text))
+        
+        for start in range(0, len(fresh), batch_size):
+            batch = fresh[start:start + batch_size]
+            self.collection.upsert(
+                documents=[chunk for _, _, chunk, _, _ in batch],
+                metadatas=[
+                    chunk_metadata(source, i, begin, end) for _, i, _, begin, end in batch
+                ],
+                ids=[cid for cid, _, _, _, _ in batch]
+            )
+        # Kept chunks keep their embedding; only their position changes
+        for start in range(0, len(moved), batch_size):
+            batch = moved[start:start + batch_size]
+            self.collection.update(
+                ids=[cid for cid, _, _, _ in batch],
+                metadatas=[chunk_metadata(source, i, begin, end) for _, i, begin, end in batch]
+            )
+        if stale:
+            self.collection.delete(ids=sorted(stale))
+        
+        self.manifest.record(source, digest, placed)
+        self.manifest.save()
+        return source_key(source)
+
+    def ingest_many(self, items: Iterable[IngestItem], **options) -> Dict[str, Any]:
+        """
+        Ingest many documents through the streaming pipeline.
+        Items are file paths or (source, text) pairs; options go to
+        IngestPipeline (batch_size, queue_size, checkpoint_path, on_progress,
+        pdf_workers, save_every, save_interval).
+        Unchanged sources are skipped using the manifest.
+        Returns the final progress report.
+        """
+        options.setdefault("manifest", self.manifest)
+        return IngestPipeline(self, **options).run(items)
 
     def search(self, query: str, n_results: int = 3) -> List[Dict[str, Any]]:
         """
@@ -54,50 +160,17 @@ class RAGEngine:
                 })
         return output
 
-    def _chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    def _chunk_text(
+        self,
+        text: str,
+        max_tokens: int = DEFAULT_CHUNK_TOKENS,
+        overlap_tokens: int = DEFAULT_OVERLAP_TOKENS
+    ) -> List[Tuple[str, int, int]]:
         """
-        Simple text chunking
+        Split text on sentence/paragraph boundaries within a token budget.
+        Returns (chunk, start, end) with character offsets into text.
         """
-        if len(text) <= chunk_size:
-            return [text]
-            
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + chunk_size
-            chunk = text[start:end]
-            chunks.append(chunk)
-            start += chunk_size - overlap
-        return chunks
+        return chunk_text(text, max_tokens, overlap_tokens)
 
 
 rag_engine = RAGEngine()
-
-import io
-import pypdf
-import docx
-
-def process_file_content(file_content: bytes, filename: str) -> str:
-    """Extract text from file content based on extension"""
-    filename = filename.lower()
-    text = ""
-    
-    try:
-        if filename.endswith('.pdf'):
-            pdf = pypdf.PdfReader(io.BytesIO(file_content))
-            for page in pdf.pages:
-                text += page.extract_text() + "\n"
-                
-        elif filename.endswith('.docx'):
-            doc = docx.Document(io.BytesIO(file_content))
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-                
-        elif filename.endswith('.txt') or filename.endswith('.md'):
-            text = file_content.decode('utf-8', errors='ignore')
-            
-    except Exception as e:
-        print(f"Error processing file {filename}: {e}")
-        return ""
-        
-    return text
@@ -0,0 +1,290 @@
+"""
+Async web search shared by both agents
+"""
+
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from html import unescape
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+
+DEFAULT_SEARCH_URL = os.getenv("SEARCH_URL", "https://html.duckduckgo.com/html/")
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+_TAGS = re.compile(r"<[^>]*>")
+_HREF = re.compile(r'href="([^"]*)"')
+_TAG_NAME = re.compile(r"<\s*([A-Za-z][A-Za-z0-9]*)")
+
+TITLE_CLASS = "result__a"
+SNIPPET_CLASS = "result__snippet"
+
+# Bytes kept behind the scan position so an opening "<" before a class marker survives trimming
+_LOOKBEHIND = 1024
+
+
+def _clean(fragment: str) -> str:
+    """Strip inner tags, decode entities and collapse whitespace"""
+    return " ".join(unescape(_TAGS.sub("", fragment)).split())
+
+
+class ResultParser:
+    """
+    Single-pass, incremental parser for DuckDuckGo HTML results
+
+    Feed it chunks as they arrive. It jumps between `result__a` and
+    `result__snippet` class markers with str.find (no backtracking regex
+    over the page), extracts (title, snippet, link) tuples and sets `done`
+    after `max_results`, at which point the rest of the page is ignored.
+    Consumed input is discarded, so memory stays bounded while streaming.
+    """
+
+    def __init__(self, max_results: int):
+        self.max_results = max_results
+        self.results: List[Tuple[str, str, str]] = []
+        self.done = max_results <= 0
+
+        self._buf = ""
+        self._pos = 0
+        self._title: Optional[str] = None
+        self._link = ""
+
+    def feed(self, chunk: str):
+        if self.done:
+            return
+        self._buf += chunk
+        self._scan()
+
+        # Drop what has been consumed, keeping a little context behind the scan position
+        cut = self._pos - _LOOKBEHIND
+        if cut > 0:
+            self._buf = self._buf[cut:]
+            self._pos -= cut
+
+    def close(self):
+        """Flush a trailing result whose snippet never arrived"""
+        if self._title is not None and not self.done:
+            self._emit("")
+
+    def _emit(self, snippet: str):
+        self.results.append((self._title, snippet, self._link))
+        self._title = None
+        if len(self.results) >= self.max_results:
+            self.done = True
+
+    def _find_class(self, name: str, start: int) -> int:
+        """Position of a whole class token, or -1 if absent (or cut off at the end)"""
+        buf = self._buf
+        while True:
+            i = buf.find(name, start)
+            end = i + len(name)
+            if i == -1 or end >= len(buf):
+                return -1
+            if buf[end] in "\" '":
+                return i
+            start = end
+
+    def _element(self, marker: int):
+        """(opening tag, inner html, end offset) of the element holding marker, or None if incomplete"""
+        buf = self._buf
+        open_start = buf.rfind("<", 0, marker)
+        open_end = buf.find(">", marker)
+        if open_start == -1 or open_end == -1:
+            return None
+
+        tag = _TAG_NAME.match(buf, open_start)
+        if tag is None:
+            return None
+        closing = f"</{tag.group(1)}>"
+        close = buf.find(closing, open_end)
+        if close == -1:
+            return None
+
+        return buf[open_start:open_end], buf[open_end + 1:close], close + len(closing)
+
+    def _scan(self):
+        while not self.done:
+            if self._title is None:
+                marker = self._find_class(TITLE_CLASS, self._pos)
+                if marker == -1:
+                    self._pos = max(self._pos, len(self._buf) - len(TITLE_CLASS))
+                    return
+                element = self._element(marker)
+                if element is None:
+                    self._pos = max(self._pos, marker - 1)
+                    return
+
+                opening, inner, self._pos = element
+                href = _HREF.search(opening)
+                self._link = unescape(href.group(1)) if href else ""
+                self._title = _clean(inner)
+            else:
+                snippet = self._find_class(SNIPPET_CLASS, self._pos)
+                next_title = self._find_class(TITLE_CLASS, self._pos)
+                if next_title != -1 and (snippet == -1 or next_title < snippet):
+                    # This result has no snippet
+                    self._emit("")
+                    continue
+                if snippet == -1:
+                    self._pos = max(self._pos, len(self._buf) - len(SNIPPET_CLASS))
+                    return
+                element = self._element(snippet)
+                if element is None:
+                    self._pos = max(self._pos, snippet - 1)
+                    return
+
+                _, inner, self._pos = element
+                self._emit(_clean(inner))
+
+
+def parse_results(html: str, max_results: int) -> List[Tuple[str, str, str]]:
+    """Extract (title, snippet, link) tuples from a DuckDuckGo HTML results page"""
+    parser = ResultParser(max_results)
+    parser.feed(html)
+    parser.close()
+    return parser.results
+
+
+def format_results(query: str, results: List[Tuple[str, str, str]]) -> str:
+    if not results:
+        return f"No results found for: {query}"
+
+    lines = [
+        f"{i + 1}. **{title}**\n   {snippet}\n   URL: {link}\n"
+        for i, (title, snippet, link) in enumerate(results)
+    ]
+    return f" **Web Search Results for: {query}**\n\n" + "\n".join(lines)
+
+
+class WebSearch:
+    """
+    DuckDuckGo HTML search over one pooled httpx.AsyncClient
+
+    - Keep-alive connections are reused, so repeat searches skip the TLS handshake.
+    - Concurrent searches for the same query share one in-flight request.
+    - Parsed results are cached for `cache_ttl` seconds.
+
+    Point `url` at a local server serving a saved results page to run offline.
+    """
+
+    def __init__(
+        self,
+        url: str = DEFAULT_SEARCH_URL,
+        timeout: float = 10.0,
+        max_connections: int = 10,
+        cache_ttl: float = 300.0,
+        cache_size: int = 256
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, List]]" = OrderedDict()
+        self.stats = {"requests": 0, "cache_hits": 0, "deduplicated": 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily (and per event loop) since the pool is bound to the loop
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                headers={"User-Agent": USER_AGENT},
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    async def _fetch(self, query: str, max_results: int) -> List[Tuple[str, str, str]]:
+        self.stats["requests"] += 1
+        parser = ResultParser(max_results)
+
+        async with self._get_client().stream("POST", self.url, data={"q": query}) as response:
+            if response.status_code != 200:
+                raise httpx.HTTPStatusError(
+                    f"Search failed with status code: {response.status_code}",
+                    request=response.request,
+                    response=response
+                )
+            # Parse chunks as they arrive and stop parsing once enough results
+            # are in; the rest is drained unparsed so the connection stays pooled
+            async for chunk in response.aiter_text():
+                if not parser.done:
+                    parser.feed(chunk)
+
+        parser.close()
+        return parser.results
+
+    async def _fetch_and_cache(self, key: Tuple[str, int], query: str, max_results: int):
+        results = await self._fetch(query, max_results)
+        self._cache[key] = (time.monotonic() + self.cache_ttl, results)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return results
+
+    def _finished(self, key: Tuple[str, int], task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark retrieved so a failure whose callers all left is not logged
+            task.exception()
+
+    async def results(self, query: str, max_results: int = 5) -> List[Tuple[str, str, str]]:
+        """
+        Cached, de-duplicated search returning (title, snippet, link) tuples
+
+        The request runs in its own task, owned by the in-flight map rather
+        than by whichever caller started it. Every caller awaits it through
+        asyncio.shield, so a cancelled caller (tool timeout, disconnected
+        client) leaves the others waiting on the same request unaffected.
+        """
+        key = (query.strip().lower(), max_results)
+
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return cached[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["deduplicated"] += 1
+        else:
+            task = asyncio.get_running_loop().create_task(
+                self._fetch_and_cache(key, query, max_results)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+
+        return await asyncio.shield(task)
+
+    async def search(self, query: str, max_results: int = 5) -> str:
+        """Search and format results for the model, never raising"""
+        try:
+            return format_results(query, await self.results(query, max_results))
+        except httpx.HTTPStatusError as e:
+            return str(e)
+        except httpx.TimeoutException:
+            return "Search timed out. Please try again."
+        except Exception as e:
+            return f"Search error: {str(e)}"
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+web_search = WebSearch()
@@ -0,0 +1,249 @@
+"""
+Durable conversation store backed by SQLite
+"""
+
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from agent.memory import ConversationStore, InMemoryConversationStore
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id);
+"""
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Append-only conversation log in SQLite with an in-memory hot cache
+
+    - Every message is one INSERT; saving a turn never rewrites history.
+    - Conversations are read from disk lazily, on first access, and only
+      the last `max_messages` of them (the cache's cap) are loaded.
+    - Writes are handed to a writer thread, which groups them into one
+      transaction and commits (fsyncs) after `commit_every` messages or
+      `commit_interval` seconds, whichever comes first. append() never
+      waits for it; call close() on shutdown.
+    - A read first waits for queued writes and any commit in progress.
+      aget() and adelete() do that in a worker thread and are what the
+      agents use on the event loop. get(), delete() and `in` block the
+      caller on a cache miss.
+
+    Evicting a conversation from the cache only drops it from memory;
+    delete() removes it from disk as well.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        encode: Callable[[Any], str],
+        decode: Callable[[str], Any],
+        cache: Optional[InMemoryConversationStore] = None,
+        commit_every: int = 64,
+        commit_interval: float = 1.0
+    ):
+        self.path = path
+        self.encode = encode
+        self.decode = decode
+        self.cache = cache if cache is not None else InMemoryConversationStore()
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit off at the sqlite3 level; transactions are managed explicitly
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(SCHEMA)
+
+        # The connection is shared by the writer thread and cache-miss reads
+        self._lock = threading.Lock()
+        self._writes: queue.Queue = queue.Queue()
+        self._pending = 0
+        self._first_pending_at = 0.0
+        self._counters = {"loads": 0, "writes": 0, "commits": 0}
+
+        self._writer = threading.Thread(
+            target=self._write_loop, name="conversation-writer", daemon=True
+        )
+        self._writer.start()
+
+    def _begin(self):
+        if self._pending == 0:
+            self._conn.execute("BEGIN")
+            self._first_pending_at = time.monotonic()
+
+    def _commit(self):
+        if self._pending:
+            self._conn.execute("COMMIT")
+            self._pending = 0
+            self._counters["commits"] += 1
+
+    def _write_loop(self):
+        """Writer thread: apply queued writes and commit them in groups"""
+        while True:
+            timeout = None
+            if self._pending:
+                timeout = max(0.0, self._first_pending_at + self.commit_interval - time.monotonic())
+            try:
+                op = self._writes.get(timeout=timeout)
+            except queue.Empty:
+                # commit_interval passed with no new writes
+                with self._lock:
+                    self._commit()
+                continue
+
+            kind = op[0]
+            try:
+                with self._lock:
+                    if kind == "insert":
+                        _, conversation_id, payloads = op
+                        self._begin()
+                        self._conn.executemany(
+                            "INSERT INTO messages (conversation_id, payload) VALUES (?, ?)",
+                            [(conversation_id, payload) for payload in payloads]
+                        )
+                        self._pending += len(payloads)
+                        if (
+                            self._pending >= self.commit_every
+                            or time.monotonic() - self._first_pending_at >= self.commit_interval
+                        ):
+                            self._commit()
+                    elif kind == "delete":
+                        self._begin()
+                        self._conn.execute(
+                            "DELETE FROM messages WHERE conversation_id = ?", (op[1],)
+                        )
+                        self._pending += 1
+                        self._commit()
+                    else:
+                        self._commit()
+            except Exception as e:
+                print(f"Error writing conversations to {self.path}: {e}")
+            finally:
+                self._writes.task_done()
+                if kind == "flush":
+                    op[1].set()
+
+            if kind == "close":
+                return
+
+    def _read(self, sql: str, params: tuple) -> List[tuple]:
+        # Queued writes must reach the connection before it is read
+        self._writes.join()
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _fetch(self, conversation_id: str) -> List[Any]:
+        """The newest messages on disk; safe to call from a worker thread"""
+        limit = self.cache.max_messages or -1
+        rows = self._read(
+            "SELECT payload FROM ("
+            "  SELECT id, payload FROM messages WHERE conversation_id = ?"
+            "  ORDER BY id DESC LIMIT ?"
+            ") ORDER BY id",
+            (conversation_id, limit)
+        )
+        return [self.decode(payload) for (payload,) in rows]
+
+    def _cache_loaded(self, conversation_id: str, messages: List[Any]) -> Optional[List[Any]]:
+        if not messages:
+            return None
+        self._counters["loads"] += 1
+        return self.cache.append(conversation_id, messages)
+
+    def _load(self, conversation_id: str) -> Optional[List[Any]]:
+        return self._cache_loaded(conversation_id, self._fetch(conversation_id))
+
+    def _on_disk(self, conversation_id: str) -> bool:
+        return bool(self._read(
+            "SELECT 1 FROM messages WHERE conversation_id = ? LIMIT 1",
+            (conversation_id,)
+        ))
+
+    def get(self, conversation_id: str) -> Optional[List[Any]]:
+        messages = self.cache.get(conversation_id)
+        if messages is not None:
+            return messages
+        return self._load(conversation_id)
+
+    async def aget(self, conversation_id: str) -> Optional[List[Any]]:
+        messages = self.cache.get(conversation_id)
+        if messages is not None:
+            return messages
+        loaded = await asyncio.to_thread(self._fetch, conversation_id)
+        # Another request may have loaded or started it meanwhile
+        messages = self.cache.get(conversation_id)
+        if messages is not None:
+            return messages
+        return self._cache_loaded(conversation_id, loaded)
+
+    def create(self, conversation_id: str) -> List[Any]:
+        # Nothing hits disk until the first message is appended
+        return self.cache.create(conversation_id)
+
+    def append(self, conversation_id: str, messages: Iterable[Any]) -> List[Any]:
+        messages = list(messages)
+        if self.cache.get(conversation_id) is None:
+            # Pull existing history in first so the cache holds the full tail
+            self._load(conversation_id)
+
+        if messages:
+            self._writes.put(
+                ("insert", conversation_id, [self.encode(m) for m in messages])
+            )
+            self._counters["writes"] += len(messages)
+
+        return self.cache.append(conversation_id, messages)
+
+    def delete(self, conversation_id: str) -> bool:
+        in_cache = self.cache.delete(conversation_id)
+        on_disk = self._on_disk(conversation_id)
+        if on_disk:
+            self._writes.put(("delete", conversation_id))
+        return in_cache or on_disk
+
+    async def adelete(self, conversation_id: str) -> bool:
+        in_cache = self.cache.delete(conversation_id)
+        on_disk = await asyncio.to_thread(self._on_disk, conversation_id)
+        if on_disk:
+            self._writes.put(("delete", conversation_id))
+        return in_cache or on_disk
+
+    def __contains__(self, conversation_id: str) -> bool:
+        if conversation_id in self.cache:
+            return True
+        return self._on_disk(conversation_id)
+
+    def flush(self):
+        """Commit any buffered writes, blocking until they are on disk"""
+        done = threading.Event()
+        self._writes.put(("flush", done))
+        done.wait()
+
+    def close(self):
+        """Commit buffered writes and stop the writer thread; blocks"""
+        if not self._writer.is_alive():
+            return
+        self._writes.put(("close",))
+        self._writer.join()
+        self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.cache.stats(),
+            "backend": "sqlite",
+            "path": self.path,
+            "pending_writes": self._pending + self._writes.qsize(),
+            **self._counters,
+        }
@@ -0,0 +1,160 @@
+"""
+Wire formats for /chat/stream: plain text, Server-Sent Events and NDJSON
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, Optional
+
+from agent.context import CHARS_PER_TOKEN
+
+
+MEDIA_TYPES = {
+    "text": "text/plain",
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+# Sent while the agent is quiet (model loading, tools running) so proxies
+# neither buffer the response nor time out the idle connection
+HEARTBEATS = {
+    "text": None,
+    "sse": ": ping\n\n",
+    "ndjson": '{"type": "ping"}\n',
+}
+
+# Proxies (nginx) buffer responses unless told otherwise
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+_END = object()
+
+
+def negotiate_format(requested: Optional[str], accept: str = "") -> str:
+    """Pick a stream format from an explicit ?format= or the Accept header"""
+    if requested:
+        if requested not in MEDIA_TYPES:
+            raise ValueError(
+                f"Unknown stream format '{requested}', expected one of: {', '.join(MEDIA_TYPES)}"
+            )
+        return requested
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    return "text"
+
+
+def encode_event(event: Dict[str, Any], fmt: str) -> str:
+    """
+    Frame one agent event
+
+    SSE uses the event type as the event name and the whole event as JSON
+    data; NDJSON writes one JSON object per line. Plain text keeps the old
+    behaviour: only tokens, with errors in-band as "Error: ...".
+    """
+    if fmt == "sse":
+        return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+    if fmt == "ndjson":
+        return json.dumps(event, default=str) + "\n"
+
+    if event["type"] == "token":
+        return event["content"]
+    if event["type"] == "error":
+        return f"Error: {event['message']}"
+    return ""
+
+
+async def with_heartbeats(
+    events: AsyncIterator[Dict[str, Any]], interval: float
+) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    Relay events, yielding None whenever `interval` seconds pass without one
+
+    The source runs in its own task feeding a queue, so a slow model call
+    or tool does not hold up the heartbeat. Closing this generator cancels
+    that task, which closes the source and its upstream Ollama request.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put({"type": "error", "message": str(e)})
+        finally:
+            queue.put_nowait(_END)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), interval)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if event is _END:
+                return
+            yield event
+    finally:
+        producer.cancel()
+        try:
+            await producer
+        except asyncio.CancelledError:
+            pass
+
+
+async def event_stream(
+    events: AsyncIterator[Dict[str, Any]],
+    fmt: str,
+    is_disconnected=None,
+    heartbeat_seconds: float = 15.0,
+    metrics=None
+) -> AsyncIterator[str]:
+    """
+    Encode agent events for the wire, with heartbeats and a final done event
+
+    Args:
+        events: Agent event stream (stream_events of either agent)
+        fmt: "text", "sse" or "ndjson"
+        is_disconnected: Optional async callable; once it returns True the
+            stream stops and generation is cancelled
+        heartbeat_seconds: Idle time before a heartbeat is sent
+        metrics: Optional CancellationMetrics recording completed and
+            abandoned streams
+
+    Returns:
+        Async iterator of encoded chunks
+    """
+    heartbeat = HEARTBEATS[fmt]
+    streamed_chars = 0
+    finished = False
+
+    try:
+        async for event in with_heartbeats(events, heartbeat_seconds):
+            if is_disconnected is not None and await is_disconnected():
+                return
+            if event is None:
+                if heartbeat:
+                    yield heartbeat
+                continue
+            if event["type"] == "token":
+                streamed_chars += len(event["content"])
+            chunk = encode_event(event, fmt)
+            if chunk:
+                yield chunk
+
+        finished = True
+        if fmt != "text":
+            yield encode_event({"type": "done"}, fmt)
+    finally:
+        # Also reached when the server closes the generator after a failed send
+        if metrics is not None:
+            tokens = -(-streamed_chars // CHARS_PER_TOKEN)
+            if finished:
+                metrics.completed(tokens)
+            else:
+                metrics.cancelled("stream", tokens)
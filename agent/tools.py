@@ -2,19 +2,29 @@
 Tools that the AI agent can use to enhance its capabilities
 """
 
+import asyncio
+import functools
+import inspect
 import json
-import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Callable
-import httpx
+from typing import Dict, Any, Callable, List, Tuple
+
+from agent.search import web_search
 
 
 class ToolRegistry:
     """Registry for managing agent tools"""
     
-    def __init__(self):
+    def __init__(self, tool_workers: int = 4):
         self.tools: Dict[str, Callable] = {}
         self.descriptions: Dict[str, str] = {}
+        # Bumped on every change so prompt caches know when to rebuild
+        self.version = 0
+        # CPU-bound sync tools (calculate) run here so they never block the event loop
+        self._tool_executor = ThreadPoolExecutor(
+            max_workers=tool_workers, thread_name_prefix="tool"
+        )
         self._register_default_tools()
     
     def register(self, name: str, description: str):
@@ -22,6 +32,7 @@ class ToolRegistry:
         def decorator(func: Callable):
             self.tools[name] = func
             self.descriptions[name] = description
+            self.version += 1
             return func
         return decorator
     
@@ -40,7 +51,36 @@ class ToolRegistry:
             raise ValueError(f"Tool '{name}' not found")
         
         try:
-            return tool(**parameters)
+            result = tool(**parameters)
+            if inspect.isawaitable(result):
+                # Async tools outside an event loop; inside one, use aexecute
+                result = asyncio.run(result)
+            return result
+        except Exception as e:
+            return f"Error executing tool: {str(e)}"
+    
+    async def aexecute(self, name: str, parameters: Dict[str, Any]) -> Any:
+        """
+        Execute a tool from async code
+
+        Async tools (search_web) are awaited on the running loop; sync tools run
+        in the registry's thread pool, so they overlap with each other and a
+        timeout around this call can give up on them.
+        """
+        tool = self.get_tool(name)
+        if not tool:
+            raise ValueError(f"Tool '{name}' not found")
+        
+        try:
+            if inspect.iscoroutinefunction(tool):
+                return await tool(**parameters)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._tool_executor, functools.partial(tool, **parameters)
+            )
+            if inspect.isawaitable(result):
+                result = await result
+            return result
         except Exception as e:
             return f"Error executing tool: {str(e)}"
     
@@ -94,7 +134,7 @@ class ToolRegistry:
                 return f"Calculation error: {str(e)}"
         
         @self.register("search_web", "Search the web for real-time information using DuckDuckGo")
-        def search_web(query: str, max_results: int = 5) -> str:
+        async def search_web(query: str, max_results: int = 5) -> str:
             """
             Search the web using DuckDuckGo
             
@@ -105,46 +145,7 @@ class ToolRegistry:
             Returns:
                 Formatted search results with titles, snippets, and URLs
             """
-            try:
-                url = "https://html.duckduckgo.com/html/"
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-                }
-                
-                with httpx.Client(timeout=10.0) as client:
-                    response = client.post(
-                        url,
-                        data={"q": query},
-                        headers=headers,
-                        follow_redirects=True
-                    )
-                    
-                    if response.status_code != 200:
-                        return f"Search failed with status code: {response.status_code}"
-                    
-                    html = response.text
-                    results = []
-                    
-                    result_pattern = r'result__a.*?href="(.*?)".*?>(.*?)</a>.*?result__snippet.*?>(.*?)</span'
-                    matches = re.findall(result_pattern, html, re.DOTALL)
-                    
-                    for i, (link, title, snippet) in enumerate(matches[:max_results]):
-                        title = re.sub(r'<.*?>', '', title).strip()
-                        snippet = re.sub(r'<.*?>', '', snippet).strip()
-                        title = title.replace('&amp;', '&').replace('&quot;', '"')
-                        snippet = snippet.replace('&amp;', '&').replace('&quot;', '"')
-                        
-                        results.append(f"{i+1}. **{title}**\n   {snippet}\n   URL: {link}\n")
-                    
-                    if not results:
-                        return f"No results found for: {query}"
-                    
-                    return f" **Web Search Results for: {query}**\n\n" + "\n".join(results)
-                    
-            except httpx.TimeoutException:
-                return "Search timed out. Please try again."
-            except Exception as e:
-                return f"Search error: {str(e)}\nNote: Using DuckDuckGo search - no API key required!"
+            return await web_search.search(query, max_results)
         
         @self.register("get_weather", "Get weather information (simulated)")
         def get_weather(location: str) -> str:
@@ -179,31 +180,118 @@ class ToolRegistry:
 tool_registry = ToolRegistry()
 
 
-def parse_tool_call(response: str) -> tuple[str | None, Dict[str, Any] | None]:
+class ToolCallStreamParser:
     """
-    Parse a tool call from the agent's response
+    Incremental detector for tool-call syntax in a token stream
+    
+    feed() returns the text that is safe to show the user right away. A
+    line that could still turn into "TOOL_CALL:" is held back until it is
+    decided; once a tool call starts, everything from that line on is
+    captured in `tool_text` instead of being emitted. Each chunk is only
+    scanned once, together with at most one short held-back line.
+    """
+    
+    PREFIX = "TOOL_CALL:"
+    
+    def __init__(self):
+        self.tool_mode = False
+        self._pending = ""
+        self._line_decided = False
+        self._tool_parts: List[str] = []
+    
+    @property
+    def tool_text(self) -> str:
+        return "".join(self._tool_parts)
+    
+    def feed(self, chunk: str) -> str:
+        if self.tool_mode:
+            self._tool_parts.append(chunk)
+            return ""
+        
+        text = self._pending + chunk
+        self._pending = ""
+        pos = 0
+        
+        while True:
+            newline = text.find("\n", pos)
+            
+            if self._line_decided:
+                # Rest of a line already known not to be a tool call
+                if newline == -1:
+                    return text
+                self._line_decided = False
+                pos = newline + 1
+                continue
+            
+            line = text[pos:len(text) if newline == -1 else newline].lstrip()
+            if line.startswith(self.PREFIX):
+                self.tool_mode = True
+                self._tool_parts.append(text[pos:])
+                return text[:pos]
+            
+            if newline == -1:
+                if self.PREFIX.startswith(line):
+                    # Could still become a tool call; wait for more tokens
+                    self._pending = text[pos:]
+                    return text[:pos]
+                self._line_decided = True
+                return text
+            
+            pos = newline + 1
+    
+    def finish(self) -> str:
+        """Release any held-back text once the stream has ended"""
+        if self.tool_mode:
+            return ""
+        text, self._pending = self._pending, ""
+        return text
+
+
+def parse_tool_calls(response: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Parse every tool call from the agent's response
+    
+    Each TOOL_CALL line starts a call; the PARAMETERS line that follows it
+    supplies its arguments.
     
     Args:
         response: Agent's response text
     
     Returns:
-        Tuple of (tool_name, parameters) or (None, None) if no tool call found
+        List of (tool_name, parameters) tuples in the order they appear
     """
-    lines = response.strip().split('\n')
-    tool_name = None
-    parameters = None
+    calls: List[Tuple[str, Dict[str, Any]]] = []
+    awaiting_parameters = False
     
-    for i, line in enumerate(lines):
+    for line in response.strip().split('\n'):
         if line.startswith("TOOL_CALL:"):
-            tool_name = line.replace("TOOL_CALL:", "").strip()
-        elif line.startswith("PARAMETERS:"):
+            calls.append((line.replace("TOOL_CALL:", "").strip(), {}))
+            awaiting_parameters = True
+        elif line.startswith("PARAMETERS:") and awaiting_parameters:
             param_str = line.replace("PARAMETERS:", "").strip()
             try:
                 parameters = json.loads(param_str)
             except json.JSONDecodeError:
                 parameters = {}
+            calls[-1] = (calls[-1][0], parameters if isinstance(parameters, dict) else {})
+            awaiting_parameters = False
     
-    if tool_name:
-        return tool_name, parameters or {}
+    return [(name, params) for name, params in calls if name]
+
+
+def parse_tool_call(response: str) -> tuple[str | None, Dict[str, Any] | None]:
+    """
+    Parse a tool call from the agent's response
+    
+    Args:
+        response: Agent's response text
+    
+    Returns:
+        Tuple of (tool_name, parameters) for the first tool call,
+        or (None, None) if no tool call found
+    """
+    calls = parse_tool_calls(response)
+    if calls:
+        return calls[0]
     
     return None, None
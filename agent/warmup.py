@@ -0,0 +1,61 @@
+"""
+Model warm-up and residency reporting for Ollama
+"""
+
+import time
+from typing import Any, Dict
+
+import httpx
+
+
+async def timed_warm_up(agent) -> Dict[str, Any]:
+    """
+    Run an agent's warm-up and report how long the cold load took
+
+    Args:
+        agent: AIAgent or LangGraphAgent
+
+    Returns:
+        Warm-up status with elapsed seconds
+    """
+    start = time.perf_counter()
+    try:
+        await agent.warm_up()
+        return {"warmed": True, "seconds": round(time.perf_counter() - start, 2)}
+    except Exception as e:
+        return {
+            "warmed": False,
+            "seconds": round(time.perf_counter() - start, 2),
+            "error": str(e)
+        }
+
+
+async def get_model_residency(host: str, model: str) -> Dict[str, Any]:
+    """
+    Report whether a model is currently loaded in Ollama's memory
+
+    Uses Ollama's /api/ps endpoint (the pinned ollama client predates ps()).
+
+    Args:
+        host: Ollama base URL
+        model: Model name, e.g. "phi3:latest"
+
+    Returns:
+        Residency information: loaded flag, expiry and memory footprint
+    """
+    async with httpx.AsyncClient(base_url=host, timeout=5.0) as client:
+        response = await client.get("/api/ps")
+        response.raise_for_status()
+        running = response.json().get("models", [])
+
+    for entry in running:
+        if entry.get("name") == model or entry.get("model") == model:
+            return {
+                "model": model,
+                "loaded": True,
+                "expires_at": entry.get("expires_at"),
+                "size": entry.get("size"),
+                "size_vram": entry.get("size_vram")
+            }
+
+    return {"model": model, "loaded": False}
@@ -0,0 +1,73 @@
+"""
+Concurrency benchmark for LangGraphAgent.chat
+
+Fires N independent conversations at the agent at once and reports
+throughput for increasing N. The model node is async, so throughput
+should climb until Ollama's own parallelism (OLLAMA_NUM_PARALLEL) is
+saturated. To compare against the old blocking node, run the same
+command on a checkout from before it was replaced.
+
+Requires a running Ollama with the model pulled:
+    python benchmarks/bench_concurrency.py --model phi3:latest --levels 1 2 4 8
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent.graph import LangGraphAgent
+
+PROMPT = "In one sentence, what is the capital of France?"
+
+
+async def run_level(agent: LangGraphAgent, concurrency: int, rounds: int) -> dict:
+    latencies = []
+
+    async def one():
+        start = time.perf_counter()
+        await agent.chat(PROMPT)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default="phi3:latest")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    agent = LangGraphAgent(model_name=args.model)
+
+    # Warm the model so the first level does not pay the load cost
+    await agent.chat("hi")
+
+    print(f"{'in-flight':>9} {'requests':>8} {'req/s':>8} {'p50 (s)':>8} {'p95 (s)':>8}")
+    for level in args.levels:
+        r = await run_level(agent, level, args.rounds)
+        print(
+            f"{r['concurrency']:>9} {r['requests']:>8} {r['throughput']:>8.2f} "
+            f"{r['p50']:>8.2f} {r['p95']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
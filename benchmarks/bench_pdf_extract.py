@@ -0,0 +1,116 @@
+"""
+Benchmark: serial vs process-pool PDF text extraction
+
+Writes a text-only PDF of --pages pages by hand (no PDF library needed to
+generate it), then times the old page loop with `text +=` against
+agent.extract.iter_pdf_pages at increasing worker counts. Speedup should
+be close to linear up to the number of physical cores.
+
+    python benchmarks/bench_pdf_extract.py --pages 400 --workers 1 2 4 8
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent.extract import iter_pdf_pages, process_file_content
+
+LINES_PER_PAGE = 45
+WORDS = "the quick brown fox jumps over a lazy dog while retrieval augmented generation".split()
+
+
+def make_pdf(pages: int) -> bytes:
+    """A minimal valid PDF: one Helvetica text stream per page"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for p in range(pages):
+        lines = [
+            " ".join(WORDS[(p + i + j) % len(WORDS)] for j in range(10))
+            for i in range(LINES_PER_PAGE)
+        ]
+        stream = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(
+            f"(Page {p + 1} line {i + 1}: {line}) '" for i, line in enumerate(lines)
+        ) + " ET"
+        data = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(data), data))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), pages
+    )
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(
+        b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, xref)
+    )
+    return out.getvalue()
+
+
+def old_extract(file_content: bytes) -> str:
+    """The previous process_file_content PDF branch"""
+    import pypdf
+
+    text = ""
+    pdf = pypdf.PdfReader(io.BytesIO(file_content))
+    for page in pdf.pages:
+        text += page.extract_text() + "\n"
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    levels = args.workers or sorted({1, 2, 4, cores})
+
+    pdf = make_pdf(args.pages)
+    print(f"{args.pages} pages, {len(pdf) / 1024:.0f} KB, {cores} cores")
+
+    start = time.perf_counter()
+    expected = old_extract(pdf)
+    old = time.perf_counter() - start
+    print(f"{'old serial (text +=)':>22} {old:8.2f} s")
+
+    for workers in levels:
+        start = time.perf_counter()
+        first_page = None
+        for i, _ in enumerate(iter_pdf_pages(pdf, workers=workers)):
+            if i == 0:
+                first_page = time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+        print(
+            f"{f'{workers} worker(s)':>22} {elapsed:8.2f} s  "
+            f"{old / elapsed:5.2f}x  first page after {first_page:.2f} s"
+        )
+
+    assert process_file_content(pdf, "bench.pdf") == expected, "extracted text differs"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Startup-time benchmark for agent/rag.py
+
+Each case runs in a fresh interpreter so nothing is already imported:
+
+- eager:  import agent.rag, then build everything the old module-level
+          RAGEngine() built (Chroma client, collection, embedding model)
+- lazy:   import agent.rag as it is now; nothing heavy is loaded
+- main:   import main, i.e. what the API process pays before serving
+
+Requires the RAG dependencies (chromadb, sentence-transformers):
+    python benchmarks/bench_rag_import.py --runs 5
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CASES = {
+    "eager (old import)": "import agent.rag; agent.rag.rag_engine.warm_up()",
+    "lazy (new import)": "import agent.rag",
+    "import main": "import main",
+}
+
+
+def time_case(code: str, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    # Interpreter start-up alone, subtracted from every case
+    baseline = statistics.median(time_case("pass", args.runs))
+
+    print(f"{'case':>20} {'median (s)':>11} {'min (s)':>9}")
+    for name, code in CASES.items():
+        timings = [t - baseline for t in time_case(code, args.runs)]
+        print(f"{name:>20} {statistics.median(timings):11.3f} {min(timings):9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Offline benchmark for the shared async search_web implementation
+
+Serves generated DuckDuckGo-style result pages from a local HTTP server
+and compares the old one-client-per-call search with WebSearch:
+pooled connections, in-flight de-duplication and the result cache.
+
+    python benchmarks/bench_search.py --latency 0.05 --queries 20
+"""
+
+import argparse
+import asyncio
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent.search import WebSearch, format_results
+
+
+def make_results_page(n_results: int, query: str = "python") -> str:
+    """Build an HTML page shaped like html.duckduckgo.com results"""
+    parts = ["<html><head><title>results</title></head><body><div id=\"links\">"]
+    for i in range(n_results):
+        parts.append(
+            f'<div class="result results_links web-result"><div class="links_main">'
+            f'<h2 class="result__title"><a rel="nofollow" class="result__a" '
+            f'href="https://example.com/{query}/{i}">Result {i} about <b>{query}</b> &amp; more</a></h2>'
+            f'<div class="result__extras"><span class="result__url">example.com/{i}</span></div>'
+            f'<span class="result__snippet">Snippet {i}: &quot;{query}&quot; is discussed '
+            f'<b>here</b> at length, with details.</span>'
+            f'</div></div>'
+        )
+    parts.append("</div></body></html>")
+    return "".join(parts)
+
+
+def start_server(latency: float, n_results: int):
+    """Local stand-in for the search endpoint; returns (server, url, request counter)"""
+    hits = {"count": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            query = parse_qs(self.rfile.read(length).decode()).get("q", [""])[0]
+            hits["count"] += 1
+            time.sleep(latency)
+            body = make_results_page(n_results, query).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # The default backlog of 5 drops bursts of concurrent connects
+        request_queue_size = 128
+        daemon_threads = True
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/html/", hits
+
+
+def old_search(url: str, query: str) -> str:
+    """The previous implementation: a fresh sync client per call and regex parsing"""
+    from bench_search_parser import regex_parse_results
+
+    with httpx.Client(timeout=10.0) as client:
+        response = client.post(url, data={"q": query}, follow_redirects=True)
+        return format_results(query, regex_parse_results(response.text, 5))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.05, help="server think time (s)")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--results", type=int, default=30, help="results per page")
+    args = parser.parse_args()
+
+    server, url, hits = start_server(args.latency, args.results)
+    queries = [f"query {i}" for i in range(args.queries)]
+
+    start = time.perf_counter()
+    for q in queries:
+        await asyncio.to_thread(old_search, url, q)
+    old_serial = time.perf_counter() - start
+
+    search = WebSearch(url=url, cache_ttl=60)
+
+    start = time.perf_counter()
+    outputs = await asyncio.gather(*(search.search(q) for q in queries))
+    concurrent = time.perf_counter() - start
+    assert all("Web Search Results" in out for out in outputs), outputs[0]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(search.search(q) for q in queries))
+    cached = time.perf_counter() - start
+
+    before = hits["count"]
+    start = time.perf_counter()
+    await asyncio.gather(*(search.search("same question") for _ in range(args.queries)))
+    deduped = time.perf_counter() - start
+    dedup_requests = hits["count"] - before
+
+    await search.aclose()
+    server.shutdown()
+
+    print(f"old, one client per call, serial : {old_serial * 1000:8.1f} ms for {args.queries} queries")
+    print(f"WebSearch, pooled, concurrent     : {concurrent * 1000:8.1f} ms")
+    print(f"WebSearch, cached repeat          : {cached * 1000:8.1f} ms")
+    print(
+        f"WebSearch, {args.queries} identical in flight  : {deduped * 1000:8.1f} ms "
+        f"({dedup_requests} upstream request)"
+    )
+    print(f"stats: {search.stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+Benchmark: regex vs streaming parser for DuckDuckGo result pages
+
+Compares the old lazy-DOTALL regex + per-result re.sub cleanup with
+agent.search.ResultParser on result pages of increasing size. Pass saved
+pages with --pages, otherwise pages are generated.
+
+    python benchmarks/bench_search_parser.py --sizes 10 100 1000 5000
+    python benchmarks/bench_search_parser.py --pages saved/*.html
+"""
+
+import argparse
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent.search import parse_results
+from bench_search import make_results_page
+
+RESULT_PATTERN = r'result__a.*?href="(.*?)".*?>(.*?)</a>.*?result__snippet.*?>(.*?)</span'
+
+# The regex backtracks super-linearly on pages without snippets (about 4 s
+# for 10 results), so those pages stay small and the regex runs once on them
+NO_SNIPPET_SIZES = [2, 5, 10]
+
+
+def regex_parse_results(html: str, max_results: int):
+    """The previous search_web parsing, kept for comparison"""
+    results = []
+    matches = re.findall(RESULT_PATTERN, html, re.DOTALL)
+    for link, title, snippet in matches[:max_results]:
+        title = re.sub(r'<.*?>', '', title).strip()
+        snippet = re.sub(r'<.*?>', '', snippet).strip()
+        title = title.replace('&amp;', '&').replace('&quot;', '"')
+        snippet = snippet.replace('&amp;', '&').replace('&quot;', '"')
+        results.append((title, snippet, link))
+    return results
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    number = 1
+    while timeit.timeit(fn, number=number) < 0.2 and number < 10000:
+        number *= 2
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--pages", nargs="*", help="saved result pages to use instead")
+    parser.add_argument("--max-results", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = [(Path(p).name, Path(p).read_text(encoding="utf-8", errors="ignore")) for p in args.pages]
+    else:
+        pages = [(f"{n} results", make_results_page(n)) for n in args.sizes]
+        # Snippet-less results (ads, sparse pages) make the lazy regex rescan the page
+        pages += [
+            (f"{n} no-snippet", make_results_page(n).replace("result__snippet", "result__body"))
+            for n in NO_SNIPPET_SIZES
+        ]
+
+    print(f"{'page':>14} {'KB':>8} {'regex (ms)':>11} {'parser (ms)':>12} {'speedup':>8}")
+    for name, html in pages:
+        start = timeit.default_timer()
+        old = regex_parse_results(html, args.max_results)
+        t_once = timeit.default_timer() - start
+        new = parse_results(html, args.max_results)
+        if old and [r[2] for r in old] != [r[2] for r in new]:
+            print(f"  warning: {name}: parsers disagree on links")
+
+        # A single run that slow is measurement enough; repeating it only adds minutes
+        t_old = t_once if t_once > 1.0 else best_of(lambda: regex_parse_results(html, args.max_results))
+        t_new = best_of(lambda: parse_results(html, args.max_results))
+        print(
+            f"{name:>14} {len(html) / 1024:8.1f} {t_old * 1000:11.3f} "
+            f"{t_new * 1000:12.3f} {t_old / t_new:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,10 @@
 
 // Configuration
 const API_BASE_URL = 'http://localhost:8000';
+// Render answers token by token from /chat/stream; falls back to /chat when unavailable
+const USE_STREAMING = true;
+// /chat/stream responses that mean "not supported here" rather than "failed"
+const FALLBACK_STATUSES = [404, 405, 501];
 let conversationId = null;
 let isProcessing = false;
 
@@ -115,43 +119,232 @@ async function handleSendMessage() {
     isProcessing = true;
 
     try {
-        const response = await fetch(`${API_BASE_URL}/chat`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                message: message,
-                conversation_id: conversationId,
-                stream: false
-            })
-        });
+        const streamed = USE_STREAMING && await streamMessage(message, typingId);
 
-        if (!response.ok) {
-            throw new Error('Failed to get response');
+        if (!streamed) {
+            await sendMessage(message, typingId);
         }
 
-        const data = await response.json();
+    } catch (error) {
+        console.error('Error sending message:', error);
+        removeTypingIndicator(typingId);
+        addMessage('assistant', '❌ Sorry, I encountered an error. Please make sure the backend is running.');
+    } finally {
+        isProcessing = false;
+    }
+}
 
-        // Update conversation ID
-        conversationId = data.conversation_id;
-        saveConversationToStorage();
+/**
+ * Send a message to /chat and render the full answer at once
+ */
+async function sendMessage(message, typingId) {
+    const response = await fetch(`${API_BASE_URL}/chat`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            message: message,
+            conversation_id: conversationId,
+            stream: false
+        })
+    });
 
-        // Remove typing indicator
+    if (response.status === 429 || response.status === 503) {
         removeTypingIndicator(typingId);
+        addMessage('assistant', await describeFailure(response));
+        return;
+    }
 
-        // Add assistant response
-        addMessage('assistant', data.response);
+    if (!response.ok) {
+        throw new Error('Failed to get response');
+    }
+
+    const data = await response.json();
+
+    // Update conversation ID
+    conversationId = data.conversation_id;
+    saveConversationToStorage();
+
+    // Remove typing indicator
+    removeTypingIndicator(typingId);
 
+    // Add assistant response
+    addMessage('assistant', data.response);
+}
+
+/**
+ * Message for a failed request; overload responses include the Retry-After hint
+ */
+async function describeFailure(response) {
+    if (response.status === 429 || response.status === 503) {
+        const retryAfter = response.headers.get('Retry-After');
+        const wait = retryAfter ? `in ${retryAfter} seconds` : 'in a moment';
+        return `⏳ The model is busy right now. Please try again ${wait}.`;
+    }
+
+    let detail = `HTTP ${response.status}`;
+    try {
+        const body = await response.json();
+        if (typeof body.detail === 'string') {
+            detail = body.detail;
+        }
     } catch (error) {
-        console.error('Error sending message:', error);
+        // Not a JSON error body
+    }
+    return `❌ Sorry, the request failed: ${detail}`;
+}
+
+/**
+ * Send a message to /chat/stream and render tokens as they arrive
+ * Returns false when streaming is unavailable so the caller can use /chat
+ */
+async function streamMessage(message, typingId) {
+    if (!window.ReadableStream || !window.TextDecoder) {
+        return false;
+    }
+
+    const response = await fetch(`${API_BASE_URL}/chat/stream?format=ndjson`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'application/x-ndjson'
+        },
+        body: JSON.stringify({
+            message: message,
+            conversation_id: conversationId,
+            stream: true
+        })
+    });
+
+    // Fall back to /chat only when streaming is unsupported. Any other
+    // failure (e.g. 429/503 from the admission queue) would hit /chat too
+    if (FALLBACK_STATUSES.includes(response.status) || (response.ok && !response.body)) {
+        return false;
+    }
+
+    if (!response.ok) {
         removeTypingIndicator(typingId);
-        addMessage('assistant', '❌ Sorry, I encountered an error. Please make sure the backend is running.');
-    } finally {
-        isProcessing = false;
+        addMessage('assistant', await describeFailure(response));
+        return true;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    let view = null;
+
+    // The typing indicator stays up until there is something to show
+    const getView = () => {
+        if (!view) {
+            removeTypingIndicator(typingId);
+            view = createStreamingMessage();
+        }
+        return view;
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        // One JSON event per line; a line may be split across reads
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+
+        for (const line of lines) {
+            if (line.trim()) {
+                handleStreamEvent(JSON.parse(line), getView);
+            }
+        }
+    }
+
+    getView().flush();
+    return true;
+}
+
+/**
+ * Apply one /chat/stream event to the message being streamed
+ */
+function handleStreamEvent(event, getView) {
+    switch (event.type) {
+        case 'token':
+            getView().append(event.content);
+            break;
+        case 'tool_start':
+            getView().setStatus(`🔧 Running ${event.tool}…`);
+            break;
+        case 'tool_end':
+            getView().setStatus('');
+            break;
+        case 'metadata':
+            conversationId = event.conversation_id;
+            saveConversationToStorage();
+            break;
+        case 'error':
+            if (event.retry_after) {
+                // Rejected by the admission queue after the stream started
+                getView().append(`\n⏳ The model is busy right now. Please try again in ${event.retry_after} seconds.`);
+            } else {
+                getView().append(`\n❌ ${event.message}`);
+            }
+            break;
+        default:
+            // ping and done carry nothing to render
+            break;
     }
 }
 
+/**
+ * Create an assistant message that text can be streamed into
+ *
+ * Tokens are buffered and written once per animation frame with
+ * Text.appendData, so each frame costs the size of the new text rather
+ * than re-rendering the whole answer.
+ */
+function createStreamingMessage() {
+    const textDiv = addMessage('assistant', '');
+    const textNode = document.createTextNode('');
+    textDiv.appendChild(textNode);
+
+    const statusDiv = document.createElement('div');
+    statusDiv.className = 'tool-status';
+    statusDiv.hidden = true;
+    textDiv.after(statusDiv);
+
+    let pending = '';
+    let frame = null;
+
+    const render = () => {
+        frame = null;
+        if (pending) {
+            textNode.appendData(pending);
+            pending = '';
+            scrollToBottom();
+        }
+    };
+
+    return {
+        append(text) {
+            pending += text;
+            if (frame === null) {
+                frame = requestAnimationFrame(render);
+            }
+        },
+        setStatus(text) {
+            statusDiv.textContent = text;
+            statusDiv.hidden = !text;
+            scrollToBottom();
+        },
+        flush() {
+            if (frame !== null) {
+                cancelAnimationFrame(frame);
+            }
+            render();
+        }
+    };
+}
+
 /**
  * Add message to chat
  */
@@ -192,6 +385,8 @@ function addMessage(role, content) {
 
     // Scroll to bottom
     scrollToBottom();
+
+    return textDiv;
 }
 
 /**
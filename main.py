@@ -2,31 +2,181 @@
 FastAPI backend for AI Agent
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
+import asyncio
+import json
 import uvicorn
 
+import os
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 
+from agent import core, graph
+from agent.admission import AdmissionController, AdmissionRejected
+from agent.batch import BatchScheduler
+from agent.cache import ResponseCache
+from agent.cancellation import CancellationMetrics, ClientDisconnected, run_until_disconnected
+from agent.context import estimate_tokens
+from agent.core import AIAgent
 from agent.graph import LangGraphAgent
-from models.schemas import ChatRequest, ChatResponse, HealthResponse
+from agent.memory import InMemoryConversationStore
+from agent.rag import rag_engine
+from agent.search import web_search
+from agent.storage import SQLiteConversationStore
+from agent.streaming import MEDIA_TYPES, STREAM_HEADERS, event_stream, negotiate_format
+from agent.warmup import get_model_residency, timed_warm_up
+from agent.ollama_client import client_kwargs, create_async_client, close_async_client
+from models.schemas import BatchRequest, ChatRequest, ChatResponse, HealthResponse
+
+# Configuration
+MODEL_NAME = os.getenv("MODEL_NAME", "phi3:latest")
+AGENT_BACKEND = os.getenv("AGENT_BACKEND", "langgraph")  # "langgraph" or "legacy"
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_POOL = {
+    "max_connections": int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16")),
+    "max_keepalive_connections": int(os.getenv("OLLAMA_MAX_KEEPALIVE", "8")),
+    "keepalive_expiry": float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60")),
+    "connect_timeout": float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5")),
+    "read_timeout": float(os.getenv("OLLAMA_READ_TIMEOUT", "300")),
+}
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "1") == "1"
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_SETTINGS = {
+    "max_entries": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+    "ttl_seconds": float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+    "similarity_threshold": float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.92")),
+}
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "0") == "1"
+RAG_WARMUP = os.getenv("RAG_WARMUP", "1") == "1"
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "1536"))
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "sqlite")  # "sqlite" or "memory"
+CONVERSATION_DB = os.getenv("CONVERSATION_DB", "./data/conversations.db")
+CONVERSATION_FLUSH_SECONDS = float(os.getenv("CONVERSATION_FLUSH_SECONDS", "1"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+ADMISSION_LIMITS = {
+    # Match the Ollama server's OLLAMA_NUM_PARALLEL
+    "max_concurrent": int(os.getenv("OLLAMA_NUM_PARALLEL", "4")),
+    "max_queue": int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+    "max_wait_seconds": float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "30")),
+}
+# Comma-separated Ollama hosts for /chat/batch; defaults to OLLAMA_HOST
+OLLAMA_BATCH_HOSTS = [
+    host.strip() for host in os.getenv("OLLAMA_BATCH_HOSTS", OLLAMA_HOST).split(",") if host.strip()
+]
+BATCH_PARALLEL_PER_HOST = int(os.getenv("BATCH_PARALLEL_PER_HOST", "2"))
+BATCH_MAX_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", "5000"))
+CONVERSATION_LIMITS = {
+    "max_conversations": int(os.getenv("CONVERSATION_MAX", "1000")),
+    "ttl_seconds": float(os.getenv("CONVERSATION_TTL_SECONDS", str(24 * 3600))),
+    "max_messages": int(os.getenv("CONVERSATION_MAX_MESSAGES", "200")),
+    "memory_budget_bytes": int(os.getenv("CONVERSATION_MEMORY_BUDGET_MB", "64")) * 1024 * 1024,
+}
 
 agent=None
+ollama_client=None
+batch_scheduler=None
+cancellation_metrics = CancellationMetrics()
+admission = AdmissionController(MODEL_NAME, **ADMISSION_LIMITS)
+
+
+def rejection_error(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code,
+        detail=e.detail,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def warm_up_rag():
+    """Load Chroma and the embedding model off the event loop after startup"""
+    start = asyncio.get_running_loop().time()
+    try:
+        await asyncio.to_thread(rag_engine.warm_up)
+        print(f" RAG engine ready in {asyncio.get_running_loop().time() - start:.1f}s")
+    except Exception as e:
+        print(f" Warning: RAG warm-up failed: {e}")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan events"""
-    global agent
+    global agent, ollama_client, batch_scheduler
     
     print(" Starting AI Agent...")
     
-    agent = LangGraphAgent(
-        model_name="phi3:latest"
+    # One pooled keep-alive client shared by every request
+    ollama_client = create_async_client(OLLAMA_HOST, **OLLAMA_POOL)
+    store = InMemoryConversationStore(**CONVERSATION_LIMITS)
+    
+    response_cache = None
+    if RESPONSE_CACHE:
+        embed = None
+        if RESPONSE_CACHE_SEMANTIC:
+            # Reuse the RAG engine's all-MiniLM-L6-v2 embedder; resolved on first
+            # use, inside the cache's worker thread
+            embed = lambda texts: rag_engine.embedding_fn(texts)
+        response_cache = ResponseCache(embed=embed, **RESPONSE_CACHE_SETTINGS)
+    sqlite_store = None
+    
+    if CONVERSATION_STORE == "sqlite":
+        # Same limits, now applied to the hot cache in front of the log
+        codec = core if AGENT_BACKEND == "legacy" else graph
+        store = SQLiteConversationStore(
+            CONVERSATION_DB,
+            encode=codec.encode_message,
+            decode=codec.decode_message,
+            cache=store,
+            commit_interval=CONVERSATION_FLUSH_SECONDS
+        )
+        sqlite_store = store
+    
+    if AGENT_BACKEND == "legacy":
+        agent = AIAgent(
+            model=MODEL_NAME,
+            client=ollama_client,
+            store=store,
+            context_tokens=CONTEXT_TOKENS,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            response_cache=response_cache,
+            admission=admission
+        )
+    else:
+        agent = LangGraphAgent(
+            model_name=MODEL_NAME,
+            base_url=OLLAMA_HOST,
+            client_kwargs=client_kwargs(**OLLAMA_POOL),
+            store=store,
+            context_tokens=CONTEXT_TOKENS,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            response_cache=response_cache,
+            admission=admission
+        )
+    
+    # Batch prompts are single-turn and tool-free, so they always use AIAgent;
+    # the configured host shares the pooled client and the admission queue
+    batch_clients = {
+        host: ollama_client if host == OLLAMA_HOST else create_async_client(host, **OLLAMA_POOL)
+        for host in OLLAMA_BATCH_HOSTS
+    }
+    batch_scheduler = BatchScheduler(
+        {
+            host: AIAgent(
+                model=MODEL_NAME,
+                client=client,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                response_cache=response_cache,
+                admission=admission if host == OLLAMA_HOST else None
+            )
+            for host, client in batch_clients.items()
+        },
+        parallel_per_host=BATCH_PARALLEL_PER_HOST
     )
     
     health = await agent.health_check()
@@ -35,15 +185,41 @@ async def lifespan(app: FastAPI):
         print(f" Model: {health['model']}")
         if not health.get("model_available"):
             print(f" Warning: Model '{health['model']}' not found. Please run: ollama pull {health['model']}")
+        elif OLLAMA_WARMUP:
+            # Pay the cold model load here instead of on the first /chat request
+            warmup = await timed_warm_up(agent)
+            if warmup["warmed"]:
+                print(f" Model warmed up in {warmup['seconds']}s (keep_alive={OLLAMA_KEEP_ALIVE})")
+            else:
+                print(f" Warning: Model warm-up failed: {warmup['error']}")
     else:
         print(f" Could not connect to Ollama: {health.get('error')}")
         print("   Make sure Ollama is running!")
     
-    print(" Storage: In-Memory (conversations reset on restart)")
+    # Startup does not wait for this; rag_engine.ready reports when it is done
+    rag_task = asyncio.create_task(warm_up_rag()) if RAG_WARMUP else None
+    
+    if CONVERSATION_STORE == "sqlite":
+        print(f" Storage: SQLite append-only log at {CONVERSATION_DB} (loaded lazily)")
+    else:
+        print(
+            f" Storage: In-Memory (conversations reset on restart, "
+            f"max {store.max_conversations} conversations / {store.max_messages} messages each)"
+        )
     
     yield
     
     print(" Shutting down AI Agent...")
+    if rag_task:
+        rag_task.cancel()
+    if sqlite_store:
+        # Waits for the final commit, so keep it off the event loop
+        await asyncio.to_thread(sqlite_store.close)
+    for client in batch_clients.values():
+        if client is not ollama_client:
+            await close_async_client(client)
+    await close_async_client(ollama_client)
+    await web_search.aclose()
 
 app = FastAPI(
     title="AI Agent API",
@@ -58,6 +234,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the chat UI read the admission queue's retry hint cross-origin
+    expose_headers=["Retry-After"],
 )
 
 
@@ -71,17 +249,22 @@ async def root():
         "endpoints": {
             "chat": "/chat",
             "stream": "/chat/stream",
+            "batch": "/chat/batch",
             "health": "/health",
+            "metrics": "/metrics",
+            "model_status": "/models/status",
             "clear": "/chat/clear/{conversation_id}"
         }
     }
 
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Chat with the AI agent
     
+    Generation is cancelled if the client disconnects before it finishes.
+    
     Args:
         request: Chat request with message and optional conversation_id
     
@@ -89,10 +272,16 @@ async def chat(request: ChatRequest):
         Agent's response
     """
     try:
-        result = await agent.chat(
-            user_message=request.message,
-            conversation_id=request.conversation_id
+        # The agent takes an admission slot around each Ollama call only
+        result = await run_until_disconnected(
+            agent.chat(
+                user_message=request.message,
+                conversation_id=request.conversation_id
+            ),
+            http_request.is_disconnected,
+            poll_interval=DISCONNECT_POLL_SECONDS
         )
+        cancellation_metrics.completed(estimate_tokens(result["response"]))
         
         return ChatResponse(
             response=result["response"],
@@ -101,36 +290,92 @@ async def chat(request: ChatRequest):
             metadata=result.get("metadata")
         )
     
+    except AdmissionRejected as e:
+        raise rejection_error(e)
+    
+    except ClientDisconnected:
+        cancellation_metrics.cancelled("chat")
+        # Nobody is listening; 499 is the de facto "client closed request" status
+        raise HTTPException(status_code=499, detail="Client closed request")
+    
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(request: ChatRequest, http_request: Request, format: str = None):
     """
     Stream chat response from the AI agent
     
     Args:
         request: Chat request with message and optional conversation_id
+        format: "text" (default), "sse" or "ndjson"; falls back to the Accept header
     
     Returns:
-        Streaming response
+        Streaming response. SSE and NDJSON carry typed events (token,
+        tool_start, tool_end, metadata, error, done) plus heartbeat pings.
     """
     try:
-        async def generate():
-            async for chunk in agent.chat_stream(
-                user_message=request.message,
-                conversation_id=request.conversation_id
-            ):
-                yield chunk
-        
-        return StreamingResponse(
-            generate(),
-            media_type="text/plain"
+        fmt = negotiate_format(format, http_request.headers.get("accept", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # A full queue is still a real 429. Slots are taken per Ollama call inside
+    # the agent, so a later 503 arrives in-band as an error event
+    try:
+        admission.check()
+    except AdmissionRejected as e:
+        raise rejection_error(e)
+    
+    events = agent.stream_events(
+        user_message=request.message,
+        conversation_id=request.conversation_id
+    )
+    stream = event_stream(
+        events,
+        fmt,
+        is_disconnected=http_request.is_disconnected,
+        heartbeat_seconds=STREAM_HEARTBEAT_SECONDS,
+        metrics=cancellation_metrics
+    )
+    
+    return StreamingResponse(
+        stream,
+        media_type=MEDIA_TYPES[fmt],
+        headers=STREAM_HEADERS
+    )
+
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchRequest):
+    """
+    Answer many independent prompts, streaming results as they finish
+    
+    Each prompt is a fresh single-turn conversation without tools, spread
+    over OLLAMA_BATCH_HOSTS with BATCH_PARALLEL_PER_HOST requests per host.
+    
+    Args:
+        request: Batch request with the prompts
+    
+    Returns:
+        NDJSON stream of result/error lines (with the prompt index) and a
+        final summary with throughput in tokens/sec
+    """
+    if len(request.prompts) > BATCH_MAX_PROMPTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {BATCH_MAX_PROMPTS} prompts per batch"
         )
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async def generate():
+        async for event in batch_scheduler.run(request.prompts):
+            yield json.dumps(event) + "\n"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers=STREAM_HEADERS
+    )
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -150,6 +395,43 @@ async def health():
     )
 
 
+@app.get("/models/status")
+async def model_status():
+    """
+    Report whether the configured model is resident in Ollama's memory
+    
+    Returns:
+        Residency information (loaded flag, expiry, VRAM footprint)
+    """
+    try:
+        return await get_model_residency(OLLAMA_HOST, MODEL_NAME)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Could not reach Ollama: {e}")
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Runtime counters for sizing the service
+    
+    Returns:
+        Conversation store statistics (size, hits/misses, evictions) and
+        generation cancelled by client disconnects, admission queue depth and waits
+    """
+    return {
+        "conversations": agent.conversations.stats(),
+        "context": {
+            "max_tokens": agent.context.max_tokens,
+            "dropped_messages": agent.context.dropped_messages
+        },
+        "response_cache": agent.response_cache.stats() if agent.response_cache else None,
+        "cancellation": cancellation_metrics.stats(),
+        "admission": admission.stats(),
+        "conversation_locks": agent.conversation_locks.stats(),
+        "rag": {"ready": rag_engine.ready}
+    }
+
+
 @app.delete("/chat/clear/{conversation_id}")
 async def clear_conversation(conversation_id: str):
     """
@@ -161,7 +443,7 @@ async def clear_conversation(conversation_id: str):
     Returns:
         Success status
     """
-    success = agent.clear_conversation(conversation_id)
+    success = await agent.clear_conversation(conversation_id)
     
     if not success:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -180,7 +462,7 @@ async def get_history(conversation_id: str):
     Returns:
         Conversation history
     """
-    history = agent.get_conversation_history(conversation_id)
+    history = await agent.get_conversation_history(conversation_id)
     
     if history is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -25,6 +25,11 @@ class ChatResponse(BaseModel):
     metadata: Optional[Dict[str, Any]] = Field(default=None, description="Additional metadata")
 
 
+class BatchRequest(BaseModel):
+    """Request model for the batch endpoint"""
+    prompts: List[str] = Field(..., min_length=1, description="Independent single-turn prompts")
+
+
 class ToolCall(BaseModel):
     """Represents a tool call made by the agent"""
     tool_name: str = Field(..., description="Name of the tool")